@@ -0,0 +1,214 @@
+"""
+Offline benchmarks for sengpt run against the local mock backend.
+
+Usage:
+    python benchmarks/bench.py                    Run and compare against baseline.json
+    python benchmarks/bench.py --update-baseline  Run and store the results as the new baseline
+    python benchmarks/bench.py --only parse_throughput --threshold 0.5
+
+Exits with status 1 if any benchmark regressed by more than the threshold relative to the baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baseline.json")
+sys.path.insert(0, ROOT_DIR)
+
+from mock_backend import MockBackend, MockOptions  # noqa: E402
+from sengpt.re_gpt import AsyncChatGPT  # noqa: E402
+
+
+class Benchmark:
+    def __init__(
+        self,
+        name: str,
+        unit: str,
+        higher_is_better: bool,
+        run: Callable[[], Awaitable[float]],
+    ):
+        self.name = name
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+        self.run = run
+
+    def regression(self, value: float, baseline: float) -> float:
+        """
+        How much worse value is than baseline as a fraction, negative if it is better.
+        """
+        if baseline == 0:
+            return 0
+        if self.higher_is_better:
+            return (baseline - value) / baseline
+        return (value - baseline) / baseline
+
+
+async def consume(conversation, prompt: str) -> int:
+    count = 0
+    async for _ in conversation.stream_text(prompt):
+        count += 1
+    return count
+
+
+async def parse_throughput() -> float:
+    options = MockOptions(tokens=3000, events_per_chunk=16)
+    async with MockBackend(options) as backend:
+        async with AsyncChatGPT(session_token="mock", base_url=backend.url) as gpt:
+            conversation = gpt.create_new_conversation()
+            start = time.perf_counter()
+            await consume(conversation, "benchmark")
+            # Counted as they're received since chunks that queue up while parsing are handed over joined
+            return gpt.timings.tokens / (time.perf_counter() - start)
+
+
+async def ttft_overhead() -> float:
+    async with MockBackend(MockOptions(tokens=1)) as backend:
+        async with AsyncChatGPT(session_token="mock", base_url=backend.url) as gpt:
+            samples = []
+            for _ in range(30):
+                conversation = gpt.create_new_conversation()
+                start = time.perf_counter()
+                async for _ in conversation.stream_text("benchmark"):
+                    samples.append(time.perf_counter() - start)
+                    break
+            return statistics.median(samples) * 1000
+
+
+async def peak_memory() -> float:
+    options = MockOptions(tokens=2000, events_per_chunk=64)
+    async with MockBackend(options) as backend:
+        async with AsyncChatGPT(session_token="mock", base_url=backend.url) as gpt:
+            conversation = gpt.create_new_conversation()
+            tracemalloc.start()
+            try:
+                await consume(conversation, "benchmark")
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            return peak / 1024
+
+
+def write_config(config_home: str, backend_url: str) -> None:
+    config_dir = os.path.join(config_home, "Sengpt")
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, "config.json"), "w") as f:
+        json.dump(
+            {
+                "session_token": "mock",
+                "base_url": backend_url,
+                "check_for_updates": False,
+                "default_mode": "query",
+                "no_glow": True,
+            },
+            f,
+        )
+
+
+async def time_subprocess(args: list[str], env: dict[str, str], runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            *args,
+            env=env,
+            cwd=ROOT_DIR,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        if process.returncode:
+            raise RuntimeError(f"{args} failed: {stderr.decode()}")
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+async def startup_import() -> float:
+    with tempfile.TemporaryDirectory() as config_home:
+        write_config(config_home, "http://127.0.0.1:9")
+        env = {**os.environ, "XDG_CONFIG_HOME": config_home}
+        return await time_subprocess(["-c", "import sengpt.main"], env, runs=5)
+
+
+async def startup_query() -> float:
+    async with MockBackend(MockOptions(tokens=20)) as backend:
+        with tempfile.TemporaryDirectory() as config_home:
+            write_config(config_home, backend.url)
+            env = {**os.environ, "XDG_CONFIG_HOME": config_home}
+            return await time_subprocess(["-m", "sengpt", "benchmark"], env, runs=5)
+
+
+BENCHMARKS = (
+    Benchmark("parse_throughput", "tokens/s", True, parse_throughput),
+    Benchmark("ttft_overhead", "ms", False, ttft_overhead),
+    Benchmark("startup_import", "ms", False, startup_import),
+    Benchmark("startup_query", "ms", False, startup_query),
+    Benchmark("peak_memory", "KiB", False, peak_memory),
+)
+
+
+def load_baseline() -> dict[str, float]:
+    try:
+        with open(BASELINE_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+async def run_benchmarks(benchmarks: list[Benchmark]) -> dict[str, float]:
+    results = {}
+    for benchmark in benchmarks:
+        results[benchmark.name] = round(await benchmark.run(), 3)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline sengpt benchmarks")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Fraction a benchmark may regress by before failing, defaults to 0.25",
+    )
+    parser.add_argument("--only", nargs="*", help="Names of the benchmarks to run")
+    args = parser.parse_args()
+
+    benchmarks = [b for b in BENCHMARKS if not args.only or b.name in args.only]
+    results = asyncio.run(run_benchmarks(benchmarks))
+    baseline = load_baseline()
+
+    regressed = False
+    for benchmark in benchmarks:
+        value = results[benchmark.name]
+        line = f"{benchmark.name:<20}{value:>14.3f} {benchmark.unit}"
+        if (baseline_value := baseline.get(benchmark.name)) is not None:
+            regression = benchmark.regression(value, baseline_value)
+            line += f"  (baseline {baseline_value:.3f}, {-regression:+.1%})"
+            if regression > args.threshold:
+                regressed = True
+                line += "  REGRESSION"
+        print(line)
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({**baseline, **results}, f, indent=4)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+    elif regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
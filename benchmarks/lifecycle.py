@@ -0,0 +1,173 @@
+"""
+Checks of the clients' lifecycle run against the local mock backend.
+
+Usage:
+    python benchmarks/lifecycle.py
+    python benchmarks/lifecycle.py --max-exit-ms 100
+
+Exiting a SyncChatGPT, with and without the websocket, must take less than --max-exit-ms, and a client
+that was exited must work again when it's entered again. A hedged stream and a first wins race whose loser
+is stuck must end within --max-race-ms of their winner. Exits with status 1 if any check fails.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import aclosing
+from threading import Thread
+from typing import Callable, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from mock_backend import MockBackend, MockOptions  # noqa: E402
+from sengpt.re_gpt import AsyncChatGPT, SyncChatGPT  # noqa: E402
+from sengpt.re_gpt.concurrency import Race  # noqa: E402
+from sengpt.re_gpt.hedging import HedgePolicy  # noqa: E402
+from sengpt.re_gpt.sync_chatgpt import get_event_loop_thread  # noqa: E402
+
+
+def sync_exit_ms(websocket: bool) -> float:
+    """
+    Chat once with a SyncChatGPT and time how long leaving its with block takes.
+    """
+    loop_thread = get_event_loop_thread()
+    backend = MockBackend(MockOptions(tokens=5, websocket=websocket))
+    loop_thread.run(backend.start())
+    try:
+        gpt = SyncChatGPT(session_token="mock", base_url=backend.url, websocket_mode=websocket)
+        gpt.__enter__()
+        for _ in gpt.create_new_conversation().chat("lifecycle"):
+            pass
+        start = time.perf_counter()
+        gpt.__exit__(None, None, None)
+        return (time.perf_counter() - start) * 1000
+    finally:
+        loop_thread.run(backend.stop())
+
+
+async def async_reentry() -> None:
+    async with MockBackend(MockOptions(tokens=5)) as backend:
+        gpt = AsyncChatGPT(session_token="mock", base_url=backend.url)
+        for _ in range(2):
+            async with gpt:
+                async for _ in gpt.create_new_conversation().stream_text("lifecycle"):
+                    pass
+
+
+def sync_reentry() -> None:
+    loop_thread = get_event_loop_thread()
+    backend = MockBackend(MockOptions(tokens=5))
+    loop_thread.run(backend.start())
+    try:
+        gpt = SyncChatGPT(session_token="mock", base_url=backend.url)
+        for _ in range(2):
+            with gpt:
+                for _ in gpt.create_new_conversation().chat("lifecycle"):
+                    pass
+    finally:
+        loop_thread.run(backend.stop())
+
+
+# How long the stuck response of the race checks takes to start, far longer than they may take
+STUCK_RESPONSE_DELAY = 5
+HEDGE_DELAY = 0.2
+
+
+async def hedged_overrun_ms() -> float:
+    """
+    Time how long a hedged stream whose primary is stuck takes to end after its hedge finished.
+    """
+    options = MockOptions(tokens=5, first_token_delay=STUCK_RESPONSE_DELAY, slow_every=2)
+    async with MockBackend(options) as backend:
+        policy = HedgePolicy(default_delay=HEDGE_DELAY)
+        async with AsyncChatGPT(session_token="mock", base_url=backend.url, hedge_policy=policy) as gpt:
+            last_token = time.perf_counter()
+            async for _ in gpt.create_new_conversation().stream_text("lifecycle"):
+                last_token = time.perf_counter()
+            return (time.perf_counter() - last_token) * 1000
+
+
+async def first_wins_overrun_ms() -> float:
+    """
+    Time how long a race between two conversations, one of them stuck, takes to end after its winner finished.
+    """
+    options = MockOptions(tokens=5, first_token_delay=STUCK_RESPONSE_DELAY, slow_every=2)
+    async with MockBackend(options) as backend:
+        async with AsyncChatGPT(session_token="mock", base_url=backend.url) as gpt:
+            conversations = [gpt.create_new_conversation() for _ in range(2)]
+            race = Race([c.stream_text("lifecycle") for c in conversations])
+            last_token = time.perf_counter()
+            async with aclosing(aiter(race)) as responses:
+                async for _ in responses:
+                    last_token = time.perf_counter()
+            return (time.perf_counter() - last_token) * 1000
+
+
+def check(run: Callable[[], None], timeout: float) -> Optional[str]:
+    """
+    Run a check in a thread of its own so one that hangs fails after timeout seconds instead of hanging the script.
+
+    Returns:
+        Optional[str]: Why the check failed, None if it passed.
+    """
+    errors: list[BaseException] = []
+
+    def target() -> None:
+        try:
+            run()
+        except BaseException as e:
+            errors.append(e)
+
+    thread = Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        return f"hung for more than {timeout:g} s"
+    if errors:
+        return f"{type(errors[0]).__name__}: {errors[0]}"
+    return None
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Check the clients' exit time and re-entry")
+    parser.add_argument("--max-exit-ms", type=float, default=250, help="Longest a SyncChatGPT may take to exit, defaults to 250")
+    parser.add_argument("--max-race-ms", type=float, default=250, help="Longest a race may last after its winner finished, defaults to 250")
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds a re-entry check may take before it fails, defaults to 10")
+    args = parser.parse_args(argv)
+
+    passed = True
+    for websocket in (False, True):
+        name = f"sync exit{' over the websocket' if websocket else ''}"
+        exit_ms = sync_exit_ms(websocket)
+        line = f"{name:<28}{exit_ms:>8.1f} ms (limit {args.max_exit_ms:g})"
+        if exit_ms > args.max_exit_ms:
+            passed = False
+            line += "  TOO SLOW"
+        print(line)
+
+    for name, measure in (("hedged stream", hedged_overrun_ms), ("first wins race", first_wins_overrun_ms)):
+        overrun_ms = asyncio.run(measure())
+        line = f"{name:<28}{overrun_ms:>8.1f} ms after the winner (limit {args.max_race_ms:g})"
+        if overrun_ms > args.max_race_ms:
+            passed = False
+            line += "  TOO SLOW"
+        print(line)
+
+    checks = (
+        ("async re-entry", lambda: asyncio.run(async_reentry())),
+        ("sync re-entry", sync_reentry),
+    )
+    for name, run in checks:
+        error = check(run, args.timeout)
+        if error is not None:
+            passed = False
+        print(f"{name:<28}{'ok' if error is None else f'FAILED {error}'}")
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
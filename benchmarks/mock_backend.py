@@ -0,0 +1,447 @@
+"""
+A local stand-in for the ChatGPT backend so the client can be benchmarked offline.
+
+It speaks just enough of the protocol for sengpt: auth/session, sentinel/chat-requirements,
+the accounts check, the SSE conversation stream, register-websocket with its websocket
+frames and the conversation fetch, delete and list endpoints.
+
+Run it standalone with `python benchmarks/mock_backend.py --port 8080` and point sengpt at it
+by setting "base_url" to "http://127.0.0.1:8080" in the config file.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+import uuid
+from typing import Optional
+from urllib.parse import parse_qsl
+
+try:
+    from websockets.asyncio.server import serve as ws_serve
+except ImportError:
+    from websockets import serve as ws_serve
+
+ACCESS_TOKEN = "mock-access-token"
+MODEL_SLUG = "text-davinci-002-render-sha"
+
+
+class MockOptions:
+    def __init__(
+        self,
+        tokens: int = 200,
+        token_rate: float = 0,
+        events_per_chunk: int = 1,
+        cumulative: bool = True,
+        websocket: bool = False,
+        first_token_delay: float = 0,
+        slow_every: int = 1,
+        token_text: str = "lorem ",
+        finish_type: str = "stop",
+        continuations: int = 0,
+        fail_every: int = 0,
+    ):
+        """
+        Args:
+            tokens (int): Number of tokens in each response.
+            token_rate (float): Tokens per second, 0 streams as fast as possible.
+            events_per_chunk (int): Number of SSE events written per transport chunk.
+            cumulative (bool): Each event carries the whole message so far like the real backend, otherwise only the delta.
+            websocket (bool): Advertise the shared websocket feature and stream over it.
+            first_token_delay (float): Seconds to wait before the first token.
+            slow_every (int): Only delay the first token of every slow_every-th response, to simulate a latency tail.
+            token_text (str): The text of every token.
+            finish_type (str): The finish_details type of the final event e.g., "max_tokens".
+            continuations (int): Times each response is cut off with max_tokens before it finishes, continue actions extend the cut off message.
+            fail_every (int): Answer every fail_every-th conversation request with a 500 error, 0 never fails.
+        """
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.events_per_chunk = max(1, events_per_chunk)
+        self.cumulative = cumulative
+        self.websocket = websocket
+        self.first_token_delay = first_token_delay
+        self.slow_every = max(1, slow_every)
+        self.token_text = token_text
+        self.finish_type = finish_type
+        self.continuations = continuations
+        self.fail_every = fail_every
+
+
+class Request:
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        headers: dict[str, str],
+        body: bytes,
+        query: Optional[dict[str, str]] = None,
+    ):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.query = query or {}
+
+    def json(self) -> dict:
+        return json.loads(self.body) if self.body else {}
+
+
+class MockBackend:
+    def __init__(self, options: Optional[MockOptions] = None, host="127.0.0.1", port=0):
+        self.options = options or MockOptions()
+        self.host = host
+        self.port = port
+        self.ws_port = 0
+        self.server = None
+        self.ws_server = None
+        self.websockets = set()
+        # conversation_id -> {"title", "update_time", "messages": [(id, role, text)]}
+        self.conversations: dict[str, dict] = {}
+        self.request_count = 0
+        self.response_count = 0
+        self.conversation_request_count = 0
+        # message_id of a response cut off with max_tokens -> (parent_id, text so far, continuations left)
+        self.cut_off: dict[str, tuple[str, str, int]] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ws_server = await ws_serve(self.handle_websocket, self.host, 0)
+        self.ws_port = next(iter(self.ws_server.sockets)).getsockname()[1]
+
+    async def stop(self) -> None:
+        self.ws_server.close()
+        await self.ws_server.wait_closed()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_websocket(self, websocket, *_) -> None:
+        self.websockets.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self.websockets.discard(websocket)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while request := await self.read_request(reader):
+                self.request_count += 1
+                await self.route(request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # A response the client gave up on is still pending when the loop shuts down,
+            # asyncio's stream callback logs a traceback for handlers that end cancelled
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+        body = b""
+        if length := int(headers.get("content-length", 0)):
+            body = await reader.readexactly(length)
+        path, _, query = target.partition("?")
+        return Request(method, path, headers, body, dict(parse_qsl(query)))
+
+    @staticmethod
+    async def send_json(writer: asyncio.StreamWriter, data, status=200) -> None:
+        body = json.dumps(data).encode()
+        writer.write(
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+
+    async def route(self, request: Request, writer: asyncio.StreamWriter) -> None:
+        path = request.path
+        if path == "/api/auth/session":
+            return await self.send_json(writer, {"accessToken": ACCESS_TOKEN})
+        if path == "/backend-api/sentinel/chat-requirements":
+            return await self.send_json(writer, {"token": str(uuid.uuid4())})
+        if path.startswith("/backend-api/accounts/check"):
+            features = ["shared_websocket"] if self.options.websocket else []
+            return await self.send_json(
+                writer,
+                {
+                    "account_ordering": ["mock"],
+                    "accounts": {"mock": {"features": features}},
+                },
+            )
+        if path == "/backend-api/register-websocket":
+            return await self.send_json(
+                writer,
+                {
+                    "wss_url": f"ws://{self.host}:{self.ws_port}/?access_token={ACCESS_TOKEN}"
+                },
+            )
+        if path == "/backend-api/conversation":
+            return await self.conversation(request, writer)
+        if path == "/backend-api/conversations":
+            return await self.send_json(
+                writer,
+                self.list_conversations(
+                    int(request.query.get("offset", 0)),
+                    int(request.query.get("limit", 28)),
+                ),
+            )
+        if path.startswith("/backend-api/conversation/"):
+            conversation_id = path.rsplit("/", 1)[1]
+            if request.method == "PATCH":
+                self.conversations.pop(conversation_id, None)
+                return await self.send_json(writer, {"success": True})
+            return await self.send_json(writer, self.fetch_conversation(conversation_id))
+        if request.method == "HEAD" or path == "/":
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+            return await writer.drain()
+        await self.send_json(writer, {"detail": "Not found"}, status=404)
+
+    def list_conversations(self, offset=0, limit=28) -> dict:
+        items = sorted(
+            (
+                {
+                    "id": conversation_id,
+                    "title": conversation["title"],
+                    "update_time": conversation["update_time"],
+                }
+                for conversation_id, conversation in self.conversations.items()
+            ),
+            key=lambda item: item["update_time"],
+            reverse=True,
+        )
+        return {
+            "items": items[offset : offset + limit],
+            "total": len(items),
+            "limit": limit,
+            "offset": offset,
+        }
+
+    def seed_conversations(self, count: int, turns=2, text="lorem ipsum dolor") -> None:
+        """
+        Add conversations with the given number of user and assistant turns, for the export and search benchmarks.
+        """
+        for index in range(count):
+            messages = []
+            for turn in range(turns):
+                messages.append((str(uuid.uuid4()), "user", f"question {index}.{turn} {text}"))
+                messages.append((str(uuid.uuid4()), "assistant", f"answer {index}.{turn} {text}"))
+            self.conversations[str(uuid.uuid4())] = {
+                "title": f"Conversation {index}",
+                "update_time": time.time() + index / 1000,
+                "messages": messages,
+            }
+
+    def fetch_conversation(self, conversation_id: str) -> dict:
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            return {"detail": "Can't load conversation"}
+        mapping = {}
+        for message_id, role, text in conversation["messages"]:
+            mapping[message_id] = {
+                "id": message_id,
+                "message": {
+                    "id": message_id,
+                    "author": {"role": role},
+                    "content": {"content_type": "text", "parts": [text]},
+                    "metadata": {"model_slug": MODEL_SLUG},
+                },
+            }
+        return {
+            "title": conversation["title"],
+            "update_time": conversation["update_time"],
+            "mapping": mapping,
+            "conversation_id": conversation_id,
+        }
+
+    def build_event(
+        self,
+        conversation_id: str,
+        message_id: str,
+        parent_id: str,
+        text: str,
+        finish_type: Optional[str],
+    ) -> bytes:
+        metadata = {"parent_id": parent_id, "model_slug": MODEL_SLUG}
+        if finish_type is not None:
+            metadata["finish_details"] = {"type": finish_type}
+        event = {
+            "message": {
+                "id": message_id,
+                "author": {"role": "assistant"},
+                "content": {"content_type": "text", "parts": [text]},
+                "status": "in_progress" if finish_type is None else "finished_successfully",
+                "metadata": metadata,
+            },
+            "conversation_id": conversation_id,
+            "error": None,
+        }
+        return f"data: {json.dumps(event)}\n\n".encode()
+
+    async def generate_chunks(self, payload: dict, conversation_id: str):
+        """
+        Yield the transport chunks of one response, pacing them at the configured token rate.
+        """
+        options = self.options
+        parent_id = payload.get("parent_message_id") or str(uuid.uuid4())
+        message_id = str(uuid.uuid4())
+        text = ""
+        continuations = options.continuations
+        if payload.get("action") == "continue" and parent_id in self.cut_off:
+            # The cut off message is extended, its events carry the whole message including the earlier segments
+            message_id = parent_id
+            parent_id, text, continuations = self.cut_off.pop(message_id)
+        finish_type = "max_tokens" if continuations else options.finish_type
+        prompt = ""
+        # The user message keeps the id the client gave it
+        user_message_id = parent_id
+        if messages := payload.get("messages"):
+            prompt = messages[0]["content"]["parts"][0]
+            user_message_id = messages[0].get("id", parent_id)
+        conversation = self.conversations.setdefault(
+            conversation_id,
+            {"title": prompt[:30] or "New chat", "update_time": time.time(), "messages": []},
+        )
+        if prompt:
+            conversation["messages"].append((user_message_id, "user", prompt))
+
+        self.response_count += 1
+        if options.first_token_delay and (self.response_count - 1) % options.slow_every == 0:
+            await asyncio.sleep(options.first_token_delay)
+        start = time.perf_counter()
+        chunk = b""
+        for index in range(options.tokens):
+            text += options.token_text
+            is_last = index == options.tokens - 1
+            chunk += self.build_event(
+                conversation_id,
+                message_id,
+                parent_id,
+                text if options.cumulative else options.token_text,
+                finish_type if is_last else None,
+            )
+            if (index + 1) % options.events_per_chunk and not is_last:
+                continue
+            if is_last and continuations:
+                # Recorded before the cut off event is sent since clients may continue as soon as they see it
+                self.cut_off[message_id] = (parent_id, text, continuations - 1)
+            if options.token_rate:
+                delay = start + (index + 1) / options.token_rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+            chunk = b""
+        yield b"data: [DONE]\n\n"
+        if continuations:
+            return
+        conversation["messages"].append((message_id, "assistant", text))
+        conversation["update_time"] = time.time()
+
+    async def conversation(self, request: Request, writer: asyncio.StreamWriter) -> None:
+        self.conversation_request_count += 1
+        fail_every = self.options.fail_every
+        if fail_every and self.conversation_request_count % fail_every == 0:
+            return await self.send_json(writer, {"detail": "Something went wrong"}, status=500)
+        payload = request.json()
+        conversation_id = payload.get("conversation_id") or str(uuid.uuid4())
+        websocket_request_id = payload.get("websocket_request_id")
+        if self.options.websocket and websocket_request_id:
+            await self.send_json(
+                writer,
+                {
+                    "websocket_request_id": websocket_request_id,
+                    "conversation_id": conversation_id,
+                    "response_id": str(uuid.uuid4()),
+                },
+            )
+            asyncio.create_task(
+                self.stream_over_websocket(payload, conversation_id, websocket_request_id)
+            )
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n"
+        )
+        async for chunk in self.generate_chunks(payload, conversation_id):
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def stream_over_websocket(
+        self, payload: dict, conversation_id: str, websocket_request_id: str
+    ) -> None:
+        async for chunk in self.generate_chunks(payload, conversation_id):
+            frame = json.dumps(
+                {
+                    "websocket_request_id": websocket_request_id,
+                    "body": base64.b64encode(chunk).decode(),
+                }
+            )
+            for websocket in list(self.websockets):
+                await websocket.send(frame)
+
+
+async def serve_forever(options: MockOptions, host: str, port: int) -> None:
+    async with MockBackend(options, host, port) as backend:
+        print(f"Mock ChatGPT backend listening on {backend.url}")
+        await asyncio.Future()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-rate", type=float, default=50)
+    parser.add_argument("--events-per-chunk", type=int, default=1)
+    parser.add_argument("--delta", action="store_true", help="Send deltas instead of cumulative content")
+    parser.add_argument("--websocket", action="store_true")
+    parser.add_argument("--first-token-delay", type=float, default=0)
+    parser.add_argument("--slow-every", type=int, default=1)
+    parser.add_argument("--continuations", type=int, default=0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+    options = MockOptions(
+        tokens=args.tokens,
+        token_rate=args.token_rate,
+        events_per_chunk=args.events_per_chunk,
+        cumulative=not args.delta,
+        websocket=args.websocket,
+        first_token_delay=args.first_token_delay,
+        slow_every=args.slow_every,
+        continuations=args.continuations,
+        fail_every=args.fail_every,
+    )
+    try:
+        asyncio.run(serve_forever(options, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Replay a session recorded with `sengpt --record` through AsyncConversation, offline.
+
+Usage:
+    python benchmarks/replay.py <recording> [--max-speed] [--print]
+
+Every recorded request is replayed in order and the streaming pipeline's throughput is reported.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from sengpt.re_gpt import AsyncChatGPT  # noqa: E402
+from sengpt.re_gpt.replay import ReplayTransport  # noqa: E402
+
+
+async def replay(path: str, speed: float | None, print_output: bool) -> None:
+    transport = ReplayTransport(path, speed)
+    prompts = [
+        exchange.payload["messages"][0]["content"]["parts"][0]
+        for exchange in transport.exchanges
+        if exchange.payload.get("action") == "next"
+    ]
+    async with AsyncChatGPT(auth_token="replay", replay=transport) as gpt:
+        conversation = gpt.create_new_conversation()
+        start = time.perf_counter()
+        for prompt in prompts:
+            async for content in conversation.stream_text(prompt):
+                if print_output:
+                    print(content, end="", flush=True)
+            if print_output:
+                print()
+        elapsed = time.perf_counter() - start
+    print(gpt.timings.report(), file=sys.stderr)
+    print(
+        f"Replayed {len(transport.exchanges)} requests in {elapsed * 1000:.1f} ms",
+        file=sys.stderr,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a recorded sengpt session")
+    parser.add_argument("recording")
+    parser.add_argument("--max-speed", action="store_true")
+    parser.add_argument("--print", action="store_true", help="Print the responses")
+    args = parser.parse_args()
+    asyncio.run(replay(args.recording, None if args.max_speed else 1.0, args.print))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Soak test for long lived sessions, run against the local mock backend.
+
+Usage:
+    python benchmarks/soak.py                                 2000 turns over 16 concurrent conversations
+    python benchmarks/soak.py --turns 10000 --websocket
+    python benchmarks/soak.py --max-rss-growth 16 --top 20
+
+One AsyncChatGPT runs thousands of turns, with conversations that are continued, cancelled midway,
+failed by the backend and deleted. The process's RSS, the memory traced by tracemalloc, the live asyncio
+tasks and the client's per request state are sampled as it goes. Exits with status 1 if any of them
+grew past its threshold between the end of the warm up and the end of the run.
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import aclosing
+from typing import Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from mock_backend import MockBackend, MockOptions  # noqa: E402
+from sengpt.re_gpt import AsyncChatGPT  # noqa: E402
+from sengpt.re_gpt.errors import UnexpectedResponseError  # noqa: E402
+
+
+def rss_mb() -> float:
+    """
+    The process's resident set size, the peak instead on platforms without /proc.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class Sample:
+    def __init__(self, turn: int, gpt: AsyncChatGPT):
+        self.turn = turn
+        self.rss_mb = rss_mb()
+        self.traced_mb = tracemalloc.get_traced_memory()[0] / 1024**2
+        # Coroutine name -> live tasks running it
+        self.tasks_by_coroutine: dict[str, int] = {}
+        for task in asyncio.all_tasks():
+            coroutine = task.get_coro()
+            name = getattr(coroutine, "__qualname__", type(coroutine).__name__)
+            if name == "MockBackend.handle_connection":
+                # One per connection libcurl keeps alive, their number changes as aborted requests close theirs
+                continue
+            self.tasks_by_coroutine[name] = self.tasks_by_coroutine.get(name, 0) + 1
+        self.tasks = sum(self.tasks_by_coroutine.values())
+        # Entries that should be gone once the requests they were made for are over
+        self.client_state = len(gpt.ws_conversation_map) + len(gpt.flights)
+
+    def __str__(self) -> str:
+        return f"{self.turn:>8}{self.rss_mb:>12.1f}{self.traced_mb:>12.2f}{self.tasks:>8}{self.client_state:>8}"
+
+
+class Soak:
+    def __init__(self, gpt: AsyncChatGPT, args: argparse.Namespace):
+        self.gpt = gpt
+        self.args = args
+        self.turns = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.samples: list[Sample] = []
+
+    async def session(self, last_turn: int) -> None:
+        """
+        Keep having conversations of turns_per_conversation turns until last_turn is reached.
+        """
+        args = self.args
+        while self.turns < last_turn:
+            conversation = self.gpt.create_new_conversation()
+            for _ in range(args.turns_per_conversation):
+                if self.turns >= last_turn:
+                    break
+                self.turns += 1
+                turn = self.turns
+                try:
+                    async with aclosing(conversation.stream_text(f"turn {turn}")) as stream:
+                        async for _ in stream:
+                            if args.cancel_every and turn % args.cancel_every == 0:
+                                # Closes the stream midway like a consumer that lost interest
+                                self.cancelled += 1
+                                break
+                except UnexpectedResponseError:
+                    self.failed += 1
+                if turn % args.sample_every == 0:
+                    self.sample()
+            if conversation.conversation_id:
+                await conversation.delete()
+
+    async def run_phase(self, last_turn: int) -> None:
+        await asyncio.gather(
+            *(self.session(last_turn) for _ in range(self.args.concurrency))
+        )
+
+    def sample(self) -> Sample:
+        sample = Sample(self.turns, self.gpt)
+        self.samples.append(sample)
+        if self.args.verbose:
+            print(sample)
+        return sample
+
+    async def settled_sample(self) -> Sample:
+        """
+        Sample once nothing is in flight and the garbage is collected so samples can be compared.
+        """
+        gc.collect()
+        # Let the callbacks and finalizers that are still scheduled run
+        await asyncio.sleep(0.1)
+        return self.sample()
+
+
+async def soak(args: argparse.Namespace) -> bool:
+    options = MockOptions(
+        tokens=args.tokens,
+        events_per_chunk=4,
+        websocket=args.websocket,
+        fail_every=args.fail_every,
+    )
+    async with MockBackend(options) as backend:
+        async with AsyncChatGPT(session_token="mock", base_url=backend.url) as gpt:
+            soak = Soak(gpt, args)
+            tracemalloc.start(args.frames)
+            try:
+                start = time.perf_counter()
+                print(f"{'turn':>8}{'rss MB':>12}{'traced MB':>12}{'tasks':>8}{'state':>8}")
+                await soak.run_phase(args.warmup)
+                before = await soak.settled_sample()
+                before_snapshot = tracemalloc.take_snapshot()
+                print(f"{before}  after warm up")
+                await soak.run_phase(args.warmup + args.turns)
+                after = await soak.settled_sample()
+                after_snapshot = tracemalloc.take_snapshot()
+                print(f"{after}  at the end")
+                elapsed = time.perf_counter() - start
+            finally:
+                tracemalloc.stop()
+
+    print(
+        f"\n{soak.turns} turns in {elapsed:.1f} s, {soak.failed} failed and {soak.cancelled} cancelled on purpose"
+    )
+    print(f"\nTop {args.top} allocation sites by growth since the warm up")
+    snapshot_filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ]
+    growth = after_snapshot.filter_traces(snapshot_filters).compare_to(
+        before_snapshot.filter_traces(snapshot_filters), "lineno"
+    )
+    for stat in growth[: args.top]:
+        print(f"  {stat}")
+
+    checks = [
+        ("RSS", after.rss_mb - before.rss_mb, args.max_rss_growth, "MB"),
+        ("traced memory", after.traced_mb - before.traced_mb, args.max_traced_growth, "MB"),
+        ("live tasks", after.tasks - before.tasks, args.max_task_growth, ""),
+        ("client state", after.client_state - before.client_state, 0, ""),
+    ]
+    passed = True
+    print()
+    for name, grew, limit, unit in checks:
+        line = f"{name:<16}grew {grew:>8.2f} {unit:<2} (limit {limit})"
+        if grew > limit:
+            passed = False
+            line += "  LEAK"
+        print(line)
+    if after.tasks - before.tasks > args.max_task_growth:
+        for name, count in after.tasks_by_coroutine.items():
+            if (grew := count - before.tasks_by_coroutine.get(name, 0)) > 0:
+                print(f"  {grew} more {name}")
+    return passed
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Soak test sengpt for memory and task leaks")
+    parser.add_argument("--turns", type=int, default=2000, help="Turns after the warm up, defaults to 2000")
+    parser.add_argument("--warmup", type=int, default=200, help="Turns before the baseline is sampled, defaults to 200")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversations at once, defaults to 16")
+    parser.add_argument("--turns-per-conversation", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per response, defaults to 50")
+    parser.add_argument("--websocket", action="store_true", help="Stream over the websocket instead of SSE")
+    parser.add_argument("--fail-every", type=int, default=17, help="Fail every n-th request in the backend, 0 never fails")
+    parser.add_argument("--cancel-every", type=int, default=13, help="Stop reading every n-th response midway, 0 never does")
+    parser.add_argument("--sample-every", type=int, default=250, help="Turns between samples, defaults to 250")
+    parser.add_argument("--max-rss-growth", type=float, default=32, help="MB the RSS may grow by, defaults to 32")
+    parser.add_argument("--max-traced-growth", type=float, default=2, help="MB the traced memory may grow by, defaults to 2")
+    parser.add_argument("--max-task-growth", type=int, default=0, help="Live tasks that may be left over, defaults to 0")
+    parser.add_argument("--top", type=int, default=10, help="Allocation sites listed, defaults to 10")
+    parser.add_argument("--frames", type=int, default=1, help="Frames tracemalloc keeps per allocation, defaults to 1")
+    parser.add_argument("--verbose", action="store_true", help="Print every sample")
+    args = parser.parse_args(argv)
+    if not asyncio.run(soak(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
 import sys
+from functools import cache
+from typing import Iterable
 
 from .utils import APP_NAME_LOWER, DESCRIPTION, VERSION
 
 
 class ArgParser:
+    # Flags whose short version was given to a preconfigured prompt, see FlagRegistry's yielding
+    long_only_flags: set[str] = set()
+
     def __init__(self, args: list[str]) -> None:
         self.args, self.non_args = ArgParser.parse_args(args)
+        # Passed flag -> its value if it was passed as flag=value
+        self.flags: dict[str, str | None] = {}
+        for a in self.args:
+            flag, equals, value = a.partition("=")
+            if self.flags.get(flag) is None:
+                self.flags[flag] = value if equals else None
 
     @staticmethod
     def parse_args(args: list[str]) -> tuple[list[str], list[str]]:
@@ -59,9 +70,48 @@ Usage: sengpt [prompt] [options]
 -d, --delete                  By default conversations in interactive mode are saved on exit,           
                               this deletes then exits the interactive mode session,                     
                               this can be set to be the default behaviour in the config file                
+                                                                                                        
+-t, --timings                 Print a latency breakdown of the invocation on exit,                      
+                              pass --timings=json to print it as JSON instead                           
+                                                                                                        
+    --profile                 Profile the invocation with cProfile and tracemalloc,                     
+                              pass --profile=<directory> to choose where the reports are written        
+                                                                                                        
+-pl, --profile_loop           Like --profile but also samples what blocks the event loop                
+                                                                                                        
+    --record                  Record the raw requests and responses of the session for offline replay,  
+                              pass --record=<directory> to choose where they are saved                  
+                                                                                                        
+-m, --models                  Send the prompt to several models concurrently and show their answers     
+                              one after the other, pass --models=gpt-3.5,gpt-4 to choose the models     
+                                                                                                        
+-fw, --first_wins             With --models only show the answer that starts first                      
+                                                                                                        
+    --hedge                   If a new conversation's response is late send it again on a fresh conversation
+                              and keep whichever responds first, this can be set to be the default behaviour
+                              in the config file                                                        
+                                                                                                        
+    --export                  Export every conversation to gzip compressed JSON lines, later exports only
+                              fetch the conversations that changed, pass --export=<file> to choose where
+                              it's saved                                                                
+                                                                                                        
+    --search                  Search the locally indexed conversations, pass the words to look for as   
+                              the prompt or as --search=<words>, conversations are indexed as you use   
+                              sengpt and when exported                                                  
+                                                                                                        
+    --resume                  Continue a conversation e.g., one found with --search,                    
+                              pass --resume=<conversation id>                                           
+                                                                                                        
+    --index                   Add an export or a recorded session to the search index,                  
+                              pass --index=<file>                                                       
+                                                                                                        
+    --serve                   Serve an OpenAI compatible /v1/chat/completions on 127.0.0.1:8000,        
+                              pass --serve=<host:port> to choose where, conversations are deleted       
+                              once answered unless --save is passed                                     
 """
 
     @staticmethod
+    @cache
     def short_and_long(name: str) -> tuple[str, str]:
         long = f"--{name}"
         chars: list[str] = []
@@ -71,13 +121,125 @@ Usage: sengpt [prompt] [options]
         short = f'-{name[0]}{"".join(chars)}'
         return short, long
 
-    @staticmethod
-    def abstract_is_set(flag_name: str, args: list[str]) -> bool:
+    def is_set(self, flag_name: str, long_only=False) -> bool:
+        """
+        Check whether a flag was passed, long_only is for flags whose short version clashes with another flag's.
+        """
         short, long = ArgParser.short_and_long(flag_name)
-        return short in args or long in args
+        long_only = long_only or flag_name in ArgParser.long_only_flags
+        return long in self.flags or (not long_only and short in self.flags)
+
+    def get_value(self, flag_name: str, long_only=False) -> str | None:
+        """
+        Get the value of a flag passed as --flag_name=value or -fn=value, None if it wasn't passed that way.
+        """
+        short, long = ArgParser.short_and_long(flag_name)
+        long_only = long_only or flag_name in ArgParser.long_only_flags
+        value = self.flags.get(long)
+        if value is None and not long_only:
+            value = self.flags.get(short)
+        return value
+
+
+class FlagRegistry:
+    """
+    Hash lookups from the short and long versions of a set of flags to their names, compiled once.
+    Short versions shared by several flags are ambiguous so they're left out and reported in collisions.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str],
+        long_only: Iterable[str] = (),
+        reserved: "FlagRegistry | None" = None,
+        yielding: Iterable[str] = (),
+    ):
+        """
+        Args:
+            names (Iterable[str]): The flags' names.
+            long_only (Iterable[str]): Names of the flags that only have a long version.
+            reserved (FlagRegistry | None): Flags that take precedence e.g., the built in ones when registering the preconfigured prompts.
+            yielding (Iterable[str]): Names of the flags whose short version goes to a flag of a registry
+                that has this one as reserved, e.g., built in flags added after people configured prompts with those shorts.
+        """
+        long_only = set(long_only)
+        self.yielding = set(yielding)
+        # Names of the reserved flags whose short version was given to one of these flags
+        self.yielded: set[str] = set()
+        # Flag name -> position, matches are returned in the order the flags were registered
+        self.order: dict[str, int] = {}
+        # Short or long version -> flag name
+        self.by_flag: dict[str, str] = {}
+        self.collisions: list[str] = []
+        shorts: dict[str, list[str]] = {}
+        for name in names:
+            short, long = ArgParser.short_and_long(name)
+            if reserved is not None and long in reserved.by_flag:
+                self.collisions.append(f'"{long}" is already taken')
+                continue
+            self.order[name] = len(self.order)
+            self.by_flag[long] = name
+            if name not in long_only:
+                shorts.setdefault(short, []).append(name)
+        for short, owners in shorts.items():
+            longs = ", ".join(ArgParser.short_and_long(o)[1] for o in owners)
+            if (
+                reserved is not None
+                and len(owners) == 1
+                and reserved.by_flag.get(short) in reserved.yielding
+            ):
+                self.yielded.add(reserved.by_flag[short])
+                self.by_flag[short] = owners[0]
+            elif reserved is not None and short in reserved.by_flag:
+                self.collisions.append(
+                    f'"{short}" of {longs} is already used by {ArgParser.short_and_long(reserved.by_flag[short])[1]}'
+                )
+            elif len(owners) > 1:
+                self.collisions.append(f'"{short}" is shared by {longs}')
+            else:
+                self.by_flag[short] = owners[0]
+
+    def matches(self, args: ArgParser) -> list[str]:
+        """
+        Names of the registered flags that were passed in args.
+        """
+        names = {self.by_flag[f] for f in args.flags if f in self.by_flag}
+        return sorted(names, key=self.order.__getitem__)
+
 
-    def is_set(self, flag_name: str) -> bool:
-        return ArgParser.abstract_is_set(flag_name, self.args)
+# sengpt's own flags, the long only ones have a short version that clashes with another flag's
+# or with a prompt name people are likely to use e.g., the README's "readme" and "expain" for -r and -e.
+# The yielding ones were added after preconfigured prompts, a prompt that already used their short version keeps it
+BUILTIN_FLAGS = FlagRegistry(
+    (
+        "help",
+        "version",
+        "config_file",
+        "session_token",
+        "no_glow",
+        "copy",
+        "paste",
+        "recent_conversation",
+        "query",
+        "save",
+        "interactive",
+        "delete",
+        "timings",
+        "profile",
+        "profile_loop",
+        "record",
+        "models",
+        "first_wins",
+        "hedge",
+        "export",
+        "search",
+        "resume",
+        "index",
+        "serve",
+    ),
+    long_only=("profile", "record", "hedge", "export", "search", "resume", "index", "serve"),
+    yielding=("timings", "profile_loop", "models", "first_wins"),
+)
 
 
 SYS_ARGS = ArgParser(sys.argv[1:])
@@ -0,0 +1,67 @@
+import asyncio
+
+import pyperclip
+
+
+class Clipboard:
+    """
+    Clipboard access off the event loop, on Linux every pyperclip call spawns xclip or xsel.
+    """
+
+    prefetched: asyncio.Task | None = None
+    copies: list[asyncio.Task] = []
+    # Numbers the copies so one that's still queued when a newer one is made can be dropped
+    copy_sequence = 0
+
+    @staticmethod
+    def prefetch() -> None:
+        """
+        Start reading the clipboard in a worker thread so it overlaps with setting up the session.
+        """
+        if Clipboard.prefetched is None:
+            Clipboard.prefetched = asyncio.create_task(asyncio.to_thread(pyperclip.paste))
+
+    @staticmethod
+    async def discard_prefetch() -> None:
+        """
+        Cancel a prefetch that was never pasted e.g., the chat failed first, and retrieve its error
+        so asyncio doesn't warn that it was never retrieved.
+        """
+        prefetched, Clipboard.prefetched = Clipboard.prefetched, None
+        if prefetched is not None:
+            prefetched.cancel()
+            await asyncio.gather(prefetched, return_exceptions=True)
+
+    @staticmethod
+    async def paste() -> str:
+        # The prefetched text is only used once, later pastes read what has been copied since
+        prefetched, Clipboard.prefetched = Clipboard.prefetched, None
+        if prefetched is not None:
+            return await prefetched
+        return await asyncio.to_thread(pyperclip.paste)
+
+    @staticmethod
+    def copy(text: str) -> None:
+        """
+        Copy text in a worker thread, wait_for_copies must be awaited before exiting.
+        Copies run one after the other so the clipboard always ends up with the latest text.
+        """
+        Clipboard.copy_sequence += 1
+        previous = Clipboard.copies[-1] if Clipboard.copies else None
+        Clipboard.copies.append(
+            asyncio.create_task(Clipboard.copy_after(previous, Clipboard.copy_sequence, text))
+        )
+
+    @staticmethod
+    async def copy_after(previous: asyncio.Task | None, sequence: int, text: str) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        if sequence != Clipboard.copy_sequence:
+            # A newer copy is queued and would overwrite it anyway
+            return
+        await asyncio.to_thread(pyperclip.copy, text)
+
+    @staticmethod
+    async def wait_for_copies() -> None:
+        copies, Clipboard.copies = Clipboard.copies, []
+        await asyncio.gather(*copies)
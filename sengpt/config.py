@@ -1,7 +1,7 @@
 
 import sys
 
-from sengpt.argparser import SYS_ARGS
+from sengpt.argparser import BUILTIN_FLAGS, SYS_ARGS, ArgParser, FlagRegistry
 from .utils import APP_NAME, mkdir, OsUtils, check_repo_print
 from appdirs import user_config_dir
 import os
@@ -87,16 +87,35 @@ class Config:
             pass
         return {}  # This is here instead of in the except block to avoid type errors
 
+    @staticmethod
+    def compile_prompt_flags(preconfigured_prompts: dict[str, str]) -> FlagRegistry:
+        prompt_flags = FlagRegistry(preconfigured_prompts, reserved=BUILTIN_FLAGS)
+        ArgParser.long_only_flags.update(prompt_flags.yielded)
+        for collision in prompt_flags.collisions:
+            print(
+                f"Warning: {collision} so it can't be used for a preconfigured prompt",
+                file=sys.stderr,
+            )
+        return prompt_flags
+
     file_path = setup_config_file_path()
 
     json = load_json_config(file_path)
     username = get_from_json_config("username", "You", json)
     session_token = get_from_json_config("session_token", "", json)
+    session_tokens = get_from_json_config("session_tokens", [], json)
     model = get_from_json_config("model", "gpt-3.5", json)
     recent_conversation_id = get_from_json_config("recent_conversation_id", "", json)
     preconfigured_prompts = get_from_json_config("preconfigured_prompts", {}, json)
+    prompt_flags = compile_prompt_flags(preconfigured_prompts)
     no_glow = get_from_json_config("no_glow", False, json)
     save = get_from_json_config("save", False, json)
     delete = get_from_json_config("delete", False, json)
     copy = get_from_json_config("copy", False, json)
     default_mode = get_from_json_config("default_mode", "interactive", json)
+    base_url = get_from_json_config("base_url", "https://chat.openai.com", json)
+    check_for_updates = get_from_json_config("check_for_updates", True, json)
+    flush_interval_ms = get_from_json_config("flush_interval_ms", 33, json)
+    flush_bytes = get_from_json_config("flush_bytes", 4096, json)
+    hedge = get_from_json_config("hedge", False, json)
+    proxies = get_from_json_config("proxies", [], json)
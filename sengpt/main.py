@@ -1,15 +1,27 @@
 import asyncio
-from typing import NoReturn, cast
+from contextlib import aclosing
+from functools import cache
+from typing import AsyncIterator, NoReturn, cast
 from curl_cffi.requests.errors import RequestsError
 from curl_cffi.requests.session import AsyncSession
 from .re_gpt import AsyncChatGPT
 import sys
 import subprocess
 
-from .re_gpt.async_chatgpt import AsyncConversation
+from .re_gpt.accounts import AccountPool
+from .re_gpt.async_chatgpt import MODELS, AsyncConversation
+from .re_gpt.concurrency import STREAM_END, Race, merge
+from .re_gpt.export import Exporter
+from .re_gpt.hedging import HedgePolicy
+from .re_gpt.search import SearchIndex
 from .re_gpt.errors import UnexpectedResponseError
 from .re_gpt.sync_chatgpt import InvalidSessionToken
+from .re_gpt.profiler import PROFILE_ENV_VAR, Profiler
+from .re_gpt.proxies import ProxyPool
+from .re_gpt.replay import Recorder
+from .re_gpt.timings import Timings
 from .utils import (
+    APP_NAME_LOWER,
     REPO_TAGS_URL,
     GLOW_INSTALLATION_URL,
     V_VERSION,
@@ -18,9 +30,14 @@ from .utils import (
     print_and_exit,
 )
 from .config import Config
+from .output import StreamWriter
+from .server import ChatCompletionServer
 from .argparser import ArgParser, SYS_ARGS
-import pyperclip
+from .clipboard import Clipboard
+import json
 import os
+import threading
+import time
 
 PRINT_WITH_GLOW = not (SYS_ARGS.is_set("no_glow") or Config.no_glow)
 # isatty == is a teletypewriter == is a terminal == program invoked without piping input
@@ -32,6 +49,9 @@ IS_QUERY_MODE = (
     or INPUT_WAS_PIPED
     or (Config.default_mode == "query" and not SYS_ARGS.is_set("interactive"))
 )
+TIMINGS = Timings()
+# Several session tokens are spread over with an AccountPool
+ChatClient = AsyncChatGPT | AccountPool
 
 
 def input_handler(msg: str) -> str:
@@ -43,6 +63,24 @@ def input_handler(msg: str) -> str:
     return user_input
 
 
+async def async_input_handler(msg: str) -> str:
+    """
+    input_handler that doesn't block the event loop so background work can go on while the user types.
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[str] = loop.create_future()
+
+    def read_input() -> None:
+        user_input = input_handler(msg)
+        loop.call_soon_threadsafe(
+            lambda: future.done() or future.set_result(user_input)
+        )
+
+    # A daemon thread rather than to_thread so exiting doesn't wait on an unanswered input call
+    threading.Thread(target=read_input, daemon=True).start()
+    return await future
+
+
 def till_one_works(commands: tuple[str, ...]) -> bool:
     for c in commands:
         try:
@@ -76,6 +114,8 @@ def try_installing_glow() -> bool:
     return till_one_works(("brew install glow", "sudo port install glow"))
 
 
+# Cached since it's read in a worker thread ahead of time while the connection is warmed up
+@cache
 def get_piped_input() -> str:
     if not INPUT_WAS_PIPED:
         return ""
@@ -88,16 +128,16 @@ def get_piped_input() -> str:
     return full_input
 
 
-def generate_prompt(args: ArgParser) -> str:
+async def generate_prompt(args: ArgParser) -> str:
     args_prompt = " ".join(args.non_args)
     if args_prompt:
         args_prompt = f"{args_prompt}"
     preconfigured_prompt = " ".join(
-        value for key, value in Config.preconfigured_prompts.items() if args.is_set(key)
+        Config.preconfigured_prompts[name] for name in Config.prompt_flags.matches(args)
     )
     if preconfigured_prompt:
         preconfigured_prompt = f"{preconfigured_prompt}\n\n"
-    clipboard_text = f"{pyperclip.paste()}" if args.is_set("paste") else ""
+    clipboard_text = await Clipboard.paste() if args.is_set("paste") else ""
     if clipboard_text:
         clipboard_text = f"{clipboard_text}\n\n"
     passed_input = get_piped_input() if IS_QUERY_MODE else ""
@@ -106,18 +146,32 @@ def generate_prompt(args: ArgParser) -> str:
 
 
 async def loading_animation(event: asyncio.Event) -> None:
+    if not sys.stdout.isatty():
+        # The animation would end up in the piped output
+        return
     animation = (".   ", "..  ", ".. .", "    ")
     while not event.is_set():
         for a in animation:
-            print(f"  Thinking {a}", end="\r")
-            await asyncio.sleep(0.1)
+            print(f"  Thinking {a}", end="\r", flush=True)
+            # Stop as soon as the event is set rather than finishing the cycle
+            try:
+                await asyncio.wait_for(event.wait(), 0.1)
+                break
+            except TimeoutError:
+                pass
     print(" " * (len("Thinking") + 8), end="\r")
 
 
 def printer(text: str) -> None:
-    if PRINT_WITH_GLOW:
-        return glow_print(text)
-    print(text)
+    with TIMINGS.span("render"):
+        if PRINT_WITH_GLOW:
+            return glow_print(text)
+        print(text)
+
+
+def print_response(prompt_response: str, footer="") -> None:
+    # Without glow the response was already streamed as it arrived
+    printer(f"{prompt_response}{footer}" if PRINT_WITH_GLOW else footer)
 
 
 def glow_print(text: str) -> None:
@@ -134,68 +188,231 @@ def glow_print(text: str) -> None:
         print(
             f'Check {GLOW_INSTALLATION_URL} for an installation guide\nAlternatively you can set "no_glow" to true in your config file or pass the --no_glow flag to the program'
         )
-        os._exit(
-            1
-        )  # os._exit instead of sys.exit to avoid asyncio errors leaking cause running tasks don't respect sys.exit
+        # Every request is owned by the code awaiting it so exiting cancels and closes them cleanly
+        sys.exit(1)
+
+
+def get_fan_out_models() -> list[str]:
+    if not SYS_ARGS.is_set("models"):
+        return []
+    value = SYS_ARGS.get_value("models")
+    models = value.split(",") if value else list(MODELS)
+    for model in models:
+        if model not in MODELS:
+            print_and_exit(f'Unknown model "{model}", choose from {", ".join(MODELS)}')
+    if SYS_ARGS.is_set("recent_conversation") or SYS_ARGS.is_set("resume", long_only=True):
+        print_and_exit(
+            "--models starts new conversations so it can't be used with --recent_conversation or --resume"
+        )
+    return models
+
+
+FAN_OUT_MODELS = get_fan_out_models()
+
+
+SEARCH_INDEX_PATH = os.path.join(os.path.dirname(Config.file_path), "search.sqlite3")
+
+
+@cache
+def get_search_index() -> SearchIndex:
+    return SearchIndex(SEARCH_INDEX_PATH)
+
+
+def index_turn(conversation: AsyncConversation, prompt: str, prompt_response: str) -> None:
+    if conversation.conversation_id:
+        get_search_index().add_turn(
+            conversation.conversation_id, prompt, prompt_response, conversation.parent_id
+        )
+
+
+async def delete_and_unindex(conversation: AsyncConversation) -> None:
+    if conversation.conversation_id:
+        get_search_index().remove_conversation(conversation.conversation_id)
+    await conversation.delete()
 
 
-def load_conversation(gpt: AsyncChatGPT) -> tuple[AsyncConversation, bool]:
+def load_conversation(gpt: ChatClient) -> tuple[AsyncConversation, bool]:
     conversation_id = (
         Config.recent_conversation_id
         if SYS_ARGS.is_set("recent_conversation")
         else None
     )
+    if SYS_ARGS.is_set("resume", long_only=True):
+        resume_id = SYS_ARGS.get_value("resume", long_only=True)
+        if not resume_id:
+            print_and_exit("Pass the conversation to resume e.g., sengpt --resume=<conversation id>")
+        # A unique prefix of an indexed conversation's id is enough
+        conversation_id = get_search_index().resolve_conversation_id(resume_id) or resume_id
     if conversation_id == "":
         conversation_id = None
 
-    conversation = gpt.create_new_conversation(model=Config.model)
-    conversation.conversation_id = conversation_id
+    if conversation_id is None:
+        conversation = gpt.create_new_conversation(model=Config.model)
+    else:
+        # Stays on the account that created it
+        conversation = gpt.get_conversation(conversation_id)
+        conversation.model = Config.model
     save_conversation = (
         conversation_id is not None or Config.save or SYS_ARGS.is_set("save")
     )
     return conversation, save_conversation
 
 
+def make_stream_writer() -> StreamWriter:
+    return StreamWriter(
+        flush_interval=Config.flush_interval_ms / 1000,
+        flush_bytes=Config.flush_bytes,
+    )
+
+
 async def fetch_prompt_response(prompt: str, conversation: AsyncConversation) -> str:
-    prompt_response = ""
+    return await render_responses(conversation.stream_text(prompt))
+
+
+async def render_responses(responses: AsyncIterator[str]) -> str:
+    contents: list[str] = []
     event = asyncio.Event()
     loading_task = asyncio.create_task(loading_animation(event))
-    async for resp_json in conversation.chat(prompt):
-        content = resp_json["content"]
-        if PRINT_WITH_GLOW:
-            prompt_response += content
-            continue
-        if not event.is_set():
-            event.set()
-            await loading_task
-        print(content, end="", flush=True)
-    if PRINT_WITH_GLOW:
+    writer = None
+    # Closed as soon as rendering stops, however it stops, so an interrupted response is aborted right away
+    async with aclosing(aiter(responses)) as stream:
+        async for content in stream:
+            contents.append(content)
+            if PRINT_WITH_GLOW:
+                continue
+            if writer is None:
+                event.set()
+                await loading_task
+                writer = make_stream_writer()
+            with TIMINGS.span("render"):
+                writer.write(content)
+    if writer is not None:
+        with TIMINGS.span("render"):
+            writer.close()
+    if not event.is_set():
         event.set()
         await loading_task
-    return prompt_response
+    return "".join(contents)
+
+
+async def delete_conversations(conversations: list[AsyncConversation]) -> None:
+    await asyncio.gather(*(c.delete() for c in conversations), return_exceptions=True)
+
+
+async def fan_out_first_wins(
+    prompt: str, conversations: list[AsyncConversation]
+) -> tuple[str, AsyncConversation]:
+    """
+    Send the prompt to every conversation and stream whichever answers first, the rest are cancelled and deleted.
+    """
+    race = Race([c.stream_text(prompt) for c in conversations])
+    # Losers cancelled before the server named their conversation are found by their first message when deleted
+    prompt_response = await render_responses(race)
+    winner = conversations[cast(int, race.winner)]
+    await delete_conversations([c for c in conversations if c is not winner])
+    return prompt_response, winner
+
+
+async def fan_out_side_by_side(
+    prompt: str, conversations: list[AsyncConversation]
+) -> tuple[str, AsyncConversation]:
+    """
+    Send the prompt to every conversation and render each answer under its model's heading.
+    One answer is streamed live while the others are buffered then shown as soon as the live one finishes.
+    Only the first model's conversation is kept.
+    """
+    contents: list[list[str]] = [[] for _ in conversations]
+    finished = [False for _ in conversations]
+    # Order the answers were rendered in
+    shown: list[int] = []
+    event = asyncio.Event()
+    loading_task = asyncio.create_task(loading_animation(event))
+    writer = None
+
+    def show(index: int) -> None:
+        separator = "\n\n" if shown else ""
+        shown.append(index)
+        cast(StreamWriter, writer).write(
+            f"{separator}## {conversations[index].model}\n\n{''.join(contents[index])}"
+        )
+
+    responses = merge([c.stream_text(prompt) for c in conversations])
+    async with aclosing(responses) as stream:
+        async for index, content in stream:
+            if content is STREAM_END:
+                finished[index] = True
+            else:
+                contents[index].append(content)
+            if PRINT_WITH_GLOW:
+                continue
+            if writer is None:
+                event.set()
+                await loading_task
+                writer = make_stream_writer()
+            with TIMINGS.span("render"):
+                if not shown:
+                    show(index)
+                elif index == shown[-1] and content is not STREAM_END:
+                    writer.write(content)
+                while finished[shown[-1]] and len(shown) < len(conversations):
+                    # Prefer an answer that's already complete, then one that has started
+                    waiting = [i for i in range(len(conversations)) if i not in shown]
+                    show(max(waiting, key=lambda i: (finished[i], bool(contents[i]))))
+    if writer is not None:
+        with TIMINGS.span("render"):
+            writer.write("\n")
+            writer.close()
+    if not event.is_set():
+        event.set()
+        await loading_task
+        shown = sorted(range(len(conversations)), key=lambda i: not finished[i])
+
+    prompt_response = "\n\n".join(
+        f"## {conversations[i].model}\n\n{''.join(contents[i])}" for i in shown
+    )
+    await delete_conversations(conversations[1:])
+    return prompt_response, conversations[0]
+
+
+async def fetch_fan_out_response(
+    prompt: str, gpt: ChatClient
+) -> tuple[str, AsyncConversation]:
+    conversations = [gpt.create_new_conversation(model) for model in FAN_OUT_MODELS]
+    if SYS_ARGS.is_set("first_wins"):
+        return await fan_out_first_wins(prompt, conversations)
+    return await fan_out_side_by_side(prompt, conversations)
 
 
 async def interactive_mode(
-    args: ArgParser,
-    conversation: AsyncConversation,
-    is_first_iteration=True,
+    args: ArgParser, conversation: AsyncConversation, gpt: ChatClient
 ) -> None:
-    if is_first_iteration:
-        prompt = prepare_prompt(args)
-    else:
-        prompt = generate_prompt(args)
-        printer("\n# ChatGPT")
-    prompt_response = await fetch_prompt_response(prompt, conversation)
-    printer(f"{prompt_response}\n\n# {Config.username}")
-    handle_coping_to_clip(args, prompt_response)
-    if user_input := input_handler("> "):
+    prompt = await prepare_prompt(args)
+    while True:
+        if FAN_OUT_MODELS and conversation.conversation_id is None:
+            prompt_response, conversation = await fetch_fan_out_response(prompt, gpt)
+        else:
+            prompt_response = await fetch_prompt_response(prompt, conversation)
+        # Get the next request ready while the response is printed and the user types
+        prepare_task = asyncio.create_task(conversation.prepare_next_message())
+        print_response(prompt_response, f"\n\n# {Config.username}")
+        handle_coping_to_clip(args, prompt_response)
+        index_turn(conversation, prompt, prompt_response)
+        user_input = await async_input_handler("> ")
+        if not user_input:
+            break
         if user_input == "-d" or user_input == "--delete":
-            await conversation.delete()
+            prepare_task.cancel()
+            conversation.cancel_prefetch()
+            await delete_and_unindex(conversation)
             return
-        await interactive_mode(ArgParser(user_input.split(" ")), conversation)
-        return
+        await prepare_task
+        args = ArgParser(user_input.split(" "))
+        prompt = await generate_prompt(args)
+        printer("\n# ChatGPT")
+    prepare_task.cancel()
+    conversation.cancel_prefetch()
     if Config.delete:
-        await conversation.delete()
+        await delete_and_unindex(conversation)
         return
     await Config.update_json_async(
         "recent_conversation_id", conversation.conversation_id
@@ -204,22 +421,29 @@ async def interactive_mode(
 
 def handle_coping_to_clip(args: ArgParser, prompt_response: str) -> None:
     if args.is_set("copy") or Config.copy:
-        pyperclip.copy(prompt_response)
+        Clipboard.copy(prompt_response)
 
 
-def prepare_prompt(args: ArgParser) -> str:
-    prompt = generate_prompt(args)
+async def prepare_prompt(args: ArgParser) -> str:
+    prompt = await generate_prompt(args)
     preprompt_text = f"# {Config.username}\n{prompt}\n\n# ChatGPT\n"
     printer(preprompt_text)
     return prompt
 
 
 async def query_mode(
-    args: ArgParser, conversation: AsyncConversation, save_conversation: bool
+    args: ArgParser,
+    conversation: AsyncConversation,
+    save_conversation: bool,
+    gpt: ChatClient,
 ) -> None:
-    prompt = prepare_prompt(args)
-    prompt_response = await fetch_prompt_response(prompt, conversation)
+    prompt = await prepare_prompt(args)
+    if FAN_OUT_MODELS:
+        prompt_response, conversation = await fetch_fan_out_response(prompt, gpt)
+    else:
+        prompt_response = await fetch_prompt_response(prompt, conversation)
     if save_conversation:
+        index_turn(conversation, prompt, prompt_response)
         Config.recent_conversation_id = cast(str, conversation.conversation_id)
         task = asyncio.create_task(
             Config.update_json_async(
@@ -228,19 +452,88 @@ async def query_mode(
         )
     else:
         task = asyncio.create_task(conversation.delete())
-    printer(prompt_response)
+    print_response(prompt_response)
     handle_coping_to_clip(args, prompt_response)
     await task
 
 
-async def gpt_coroutine(gpt: AsyncChatGPT) -> None:
+async def export_conversations(gpt: ChatClient) -> None:
+    path = SYS_ARGS.get_value("export", long_only=True) or os.path.join(
+        os.path.dirname(Config.file_path), "export", "conversations.jsonl.gz"
+    )
+    print(f"Exporting conversations to {os.path.abspath(path)}")
+    exported = 0
+    # One account after the other, each run appends to the export and keeps a checkpoint of its own
+    accounts = (
+        [(account.chatgpt, account.fingerprint) for account in gpt.accounts]
+        if isinstance(gpt, AccountPool)
+        else [(gpt, None)]
+    )
+    for client, fingerprint in accounts:
+        result = await Exporter(client, path, account=fingerprint).run()
+        print(f"Done, {result}")
+        for conversation_id, error in result.failed.items():
+            print(f"Failed to export {conversation_id}: {error}", file=sys.stderr)
+        exported += result.exported
+    if exported:
+        updated = get_search_index().index_export(path)
+        print(f"Indexed {updated} conversations for --search")
+
+
+def search_conversations() -> NoReturn:
+    query = SYS_ARGS.get_value("search", long_only=True) or " ".join(SYS_ARGS.non_args)
+    if not query:
+        print_and_exit("Pass what to search for e.g., sengpt --search rust lifetimes")
+    hits = get_search_index().search(query)
+    if not hits:
+        print_and_exit(f'No matches for "{query}"')
+    for hit in hits:
+        snippet = " ".join(hit.snippet.split())
+        print(f"{hit.conversation_id}  {hit.title}\n    {hit.role}: {snippet}\n")
+    print_and_exit("Continue one with sengpt --resume=<conversation id>, a unique prefix of the id is enough")
+
+
+def index_file() -> NoReturn:
+    path = SYS_ARGS.get_value("index", long_only=True)
+    if not path:
+        print_and_exit("Pass the export or recording to index e.g., sengpt --index=conversations.jsonl.gz")
+    index = get_search_index()
+    if path.endswith(".gz"):
+        print_and_exit(f"Indexed {index.index_export(path)} conversations")
+    print_and_exit(f"Indexed {index.index_recording(path)} turns")
+
+
+async def serve(gpt: ChatClient) -> None:
+    address = SYS_ARGS.get_value("serve", long_only=True) or ""
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        print_and_exit("Pass where to serve e.g., sengpt --serve=127.0.0.1:8000")
+    server = ChatCompletionServer(
+        gpt,
+        host or "127.0.0.1",
+        int(port),
+        Config.model,
+        keep_conversations=Config.save or SYS_ARGS.is_set("save"),
+    )
+    await server.start()
+    print(f"Serving /v1/chat/completions on {server.url}")
+    await server.serve_forever()
+
+
+async def gpt_coroutine(gpt: ChatClient) -> None:
     try:
         async with gpt:
+            if SYS_ARGS.is_set("serve", long_only=True):
+                await serve(gpt)
+                return
+            if SYS_ARGS.is_set("export", long_only=True):
+                await export_conversations(gpt)
+                return
             conversation, save_conversation = load_conversation(gpt)
             if IS_QUERY_MODE:
-                await query_mode(SYS_ARGS, conversation, save_conversation)
+                await query_mode(SYS_ARGS, conversation, save_conversation, gpt)
                 return
-            await interactive_mode(SYS_ARGS, conversation)
+            await interactive_mode(SYS_ARGS, conversation, gpt)
 
     except (UnexpectedResponseError, InvalidSessionToken) as e:
         if isinstance(e, asyncio.CancelledError):
@@ -265,21 +558,145 @@ async def update_check_coroutine(session: AsyncSession) -> bool:
     return False
 
 
+def print_timings() -> None:
+    if SYS_ARGS.get_value("timings") == "json":
+        print(TIMINGS.to_json(), file=sys.stderr)
+    else:
+        print(TIMINGS.report(), file=sys.stderr)
+
+
+def get_recorder() -> Recorder | None:
+    if not SYS_ARGS.is_set("record", long_only=True):
+        return None
+    output_dir = SYS_ARGS.get_value("record", long_only=True) or os.path.join(
+        os.path.dirname(Config.file_path), "recordings"
+    )
+    return Recorder(output_dir)
+
+
+HEDGING_STATE_PATH = os.path.join(os.path.dirname(Config.file_path), "hedging.json")
+
+
+def get_hedge_policy() -> HedgePolicy | None:
+    if not (Config.hedge or SYS_ARGS.is_set("hedge", long_only=True)):
+        return None
+    policy = HedgePolicy()
+    # The times to first chunk are remembered across runs since a single query is too few samples
+    try:
+        with open(HEDGING_STATE_PATH) as f:
+            policy.load(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return policy
+
+
+def save_hedge_policy(policy: HedgePolicy) -> None:
+    try:
+        with open(HEDGING_STATE_PATH, "w") as f:
+            json.dump(policy.to_dict(), f)
+    except OSError:
+        pass
+
+
+ACCOUNTS_STATE_PATH = os.path.join(os.path.dirname(Config.file_path), "accounts.json")
+
+
+def get_session_tokens() -> list[str]:
+    # session_token comes first so the conversations made before there were several accounts stay on it
+    tokens = [Config.session_token, *Config.session_tokens]
+    return list(dict.fromkeys(token for token in tokens if token))
+
+
+def create_client(**client_options) -> ChatClient:
+    session_tokens = get_session_tokens()
+    if len(session_tokens) == 1:
+        return AsyncChatGPT(session_token=session_tokens[0], **client_options)
+    pool = AccountPool(session_tokens, **client_options)
+    # Which account each conversation is on is remembered across runs
+    try:
+        with open(ACCOUNTS_STATE_PATH) as f:
+            pool.load(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return pool
+
+
+def save_account_pool(pool: AccountPool) -> None:
+    try:
+        with open(ACCOUNTS_STATE_PATH, "w") as f:
+            json.dump(pool.to_dict(), f)
+    except OSError:
+        pass
+
+
 async def async_main() -> None:
-    gpt = AsyncChatGPT(session_token=Config.session_token)
+    hedge_policy = get_hedge_policy()
+    proxy_pool = ProxyPool(Config.proxies) if Config.proxies else None
+    if proxy_pool is not None:
+        proxy_pool.start(Config.base_url)
+    gpt = create_client(
+        timings=TIMINGS,
+        base_url=Config.base_url,
+        recorder=get_recorder(),
+        hedge_policy=hedge_policy,
+        proxy_pool=proxy_pool,
+        # Callers of the server often send the same prompt at once
+        single_flight=SYS_ARGS.is_set("serve", long_only=True),
+    )
+    gpt.prewarm()
+    # Only chats paste, --export and --serve never would
+    if SYS_ARGS.is_set("paste") and not (
+        SYS_ARGS.is_set("serve", long_only=True) or SYS_ARGS.is_set("export", long_only=True)
+    ):
+        Clipboard.prefetch()
     session = AsyncSession(impersonate="chrome110")
     try:
-        _, update_is_available = await asyncio.gather(
-            gpt_coroutine(gpt), update_check_coroutine(session)
-        )
+        if IS_QUERY_MODE:
+            await asyncio.to_thread(get_piped_input)
+        if Config.check_for_updates:
+            _, update_is_available = await asyncio.gather(
+                gpt_coroutine(gpt), update_check_coroutine(session)
+            )
+        else:
+            await gpt_coroutine(gpt)
+            update_is_available = False
         if update_is_available:
             print('\n\nUpdate available run "pip update sengpt" to install it')
     except RequestsError:
         print("Check your internet!!!")
+    if hedge_policy is not None:
+        save_hedge_policy(hedge_policy)
+    if isinstance(gpt, AccountPool):
+        save_account_pool(gpt)
+    if proxy_pool is not None:
+        proxy_pool.stop()
+    await Clipboard.discard_prefetch()
+    await Clipboard.wait_for_copies()
+    if SYS_ARGS.is_set("timings"):
+        print_timings()
+
+
+def get_profiler() -> Profiler | None:
+    sample_loop = SYS_ARGS.is_set("profile_loop")
+    if not (sample_loop or SYS_ARGS.is_set("profile", long_only=True)):
+        return None
+    output_dir = (
+        SYS_ARGS.get_value("profile", long_only=True)
+        or SYS_ARGS.get_value("profile_loop")
+        or os.environ.get(PROFILE_ENV_VAR)
+        or f"{APP_NAME_LOWER}-profile-{time.strftime('%Y%m%d-%H%M%S')}"
+    )
+    return Profiler(output_dir, sample_loop)
+
+
+async def profiled_async_main(profiler: Profiler) -> None:
+    async with profiler:
+        await async_main()
+    print(f"\nProfile written to {os.path.abspath(profiler.output_dir)}", file=sys.stderr)
 
 
 def validate_session_token() -> None | NoReturn:
-    if not Config.session_token:
+    if not get_session_tokens():
         check_repo_print("Session token must be provided during initial configuration")
 
 
@@ -298,13 +715,20 @@ def handle_static_args() -> None | NoReturn:
         Config.update_session_token()
         print("\nSuccessfully set session token")
         sys.exit()
+    if SYS_ARGS.is_set("search", long_only=True):
+        search_conversations()
+    if SYS_ARGS.is_set("index", long_only=True):
+        index_file()
 
 
 def main():
     handle_static_args()
     validate_session_token()
+    profiler = get_profiler()
     try:
-        asyncio.run(async_main())
+        asyncio.run(
+            async_main() if profiler is None else profiled_async_main(profiler)
+        )
     except KeyboardInterrupt:
         return
 
@@ -0,0 +1,70 @@
+import asyncio
+import sys
+import time
+from typing import TextIO
+
+
+class StreamWriter:
+    """
+    Coalesces streamed deltas into fewer, larger writes.
+
+    On a terminal pending text is flushed every flush_interval seconds, once flush_bytes bytes of encoded text have built up
+    or as soon as a newline arrives. When output is piped it's written to the underlying binary buffer
+    which is only flushed when it fills up or the writer is closed.
+    """
+
+    def __init__(self, stream: TextIO = sys.stdout, flush_interval=0.033, flush_bytes=4096):
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.is_tty = stream.isatty()
+        self.encoding = stream.encoding or "utf-8"
+        self.pending: list[str] = []
+        self.pending_size = 0
+        self.last_flush = time.monotonic()
+        self.flush_handle: asyncio.TimerHandle | None = None
+        self.binary = None if self.is_tty else getattr(stream, "buffer", None)
+        if self.binary is not None:
+            # Anything already printed through the text layer must come out first
+            stream.flush()
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        self.pending.append(text)
+        # Counted in encoded bytes, characters outside ASCII take more than one
+        self.pending_size += len(text) if text.isascii() else len(text.encode(self.encoding, "replace"))
+        if self.pending_size >= self.flush_bytes or (
+            self.is_tty
+            and ("\n" in text or time.monotonic() - self.last_flush >= self.flush_interval)
+        ):
+            self.flush()
+        elif self.is_tty and self.flush_handle is None:
+            # Make sure trailing text doesn't sit in the buffer when the stream pauses
+            self.flush_handle = asyncio.get_running_loop().call_later(
+                self.flush_interval, self.flush
+            )
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending.clear()
+        self.pending_size = 0
+        if self.binary is not None:
+            self.binary.write(text.encode(self.encoding, "replace"))
+            return
+        self.stream.write(text)
+        if self.is_tty:
+            self.stream.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self.binary is not None:
+            self.binary.flush()
+        else:
+            self.stream.flush()
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import math
+import time
+from typing import Optional
+
+from .async_chatgpt import AsyncChatGPT, AsyncConversation
+from .errors import InvalidSessionToken
+
+class Account:
+    def __init__(self, session_token: str, chatgpt: AsyncChatGPT):
+        self.chatgpt = chatgpt
+        # Identifies the account in saved state without saving its token again
+        self.fingerprint = hashlib.sha256(session_token.encode()).hexdigest()[:16]
+        # time.monotonic() until which no new conversations are given to it, math.inf if it can't be used at all
+        self.cooldown_until = 0.0
+        self.refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def load(self) -> int:
+        return self.chatgpt.active_streams
+
+
+class AccountPool:
+    """
+    Spreads new conversations over several accounts, each with its own authenticated client,
+    so the accounts' rate limits add up.
+
+    A conversation stays on the account that created it, every pin is kept until the conversation is deleted
+    since a conversation sent to another account fails. An account that gets rate limited is cooled down
+    for the server's Retry-After or rate_limit_cooldown seconds. An account whose access token expired is
+    cooled down while a new one is fetched with its session token, and left out for good if that fails.
+    """
+
+    def __init__(
+        self,
+        session_tokens: list[str],
+        strategy="least_loaded",
+        rate_limit_cooldown=60.0,
+        token_expired_cooldown=300.0,
+        **client_options,
+    ):
+        """
+        Args:
+            session_tokens (list[str]): A session token per account, conversations the pool doesn't know go to the first.
+            strategy (str): "least_loaded" gives new conversations to the account with the fewest responses streaming,
+                ties going round robin, "round_robin" ignores the load. Defaults to "least_loaded".
+            rate_limit_cooldown (float): Seconds a rate limited account is left out for if the server doesn't say. Defaults to 60.0.
+            token_expired_cooldown (float): Seconds an account is left out for when its access token can't be refreshed. Defaults to 300.0.
+            **client_options: Passed to every account's AsyncChatGPT e.g., timings or a shared proxy_pool.
+        """
+        if not session_tokens:
+            raise ValueError("An account pool needs at least one session token")
+        if strategy not in ("least_loaded", "round_robin"):
+            raise ValueError(f'Unknown strategy "{strategy}"')
+        self.accounts = [
+            Account(session_token, AsyncChatGPT(session_token=session_token, **client_options))
+            for session_token in dict.fromkeys(session_tokens)
+        ]
+        for account in self.accounts:
+            account.chatgpt.account_pool = self
+            # Identical messages are sent once whichever account they were given to
+            account.chatgpt.flights = self.accounts[0].chatgpt.flights
+        self.strategy = strategy
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.token_expired_cooldown = token_expired_cooldown
+        # Index of the account the next round starts at
+        self.next_index = 0
+        # conversation_id -> fingerprint of the account that created it
+        self.owners: dict[str, str] = {}
+
+    async def __aenter__(self):
+        """
+        Enter every account's client concurrently, accounts that fail to are left out.
+
+        Raises:
+            InvalidSessionToken: Or whatever else went wrong, if no account could be entered.
+        """
+        results = await asyncio.gather(
+            *(account.chatgpt.__aenter__() for account in self.accounts),
+            return_exceptions=True,
+        )
+        errors = []
+        for account, result in zip(self.accounts, results):
+            if isinstance(result, BaseException):
+                account.cooldown_until = math.inf
+                errors.append(result)
+        if len(errors) == len(self.accounts):
+            # The clients' sessions were still opened
+            await asyncio.gather(
+                *(account.chatgpt.__aexit__() for account in self.accounts),
+                return_exceptions=True,
+            )
+            raise errors[0]
+        return self
+
+    async def __aexit__(self, *_):
+        for account in self.accounts:
+            if account.refresh_task is not None:
+                account.refresh_task.cancel()
+        await asyncio.gather(
+            *(account.chatgpt.__aexit__() for account in self.accounts),
+            return_exceptions=True,
+        )
+
+    def prewarm(self) -> None:
+        """
+        Start opening every account's connection in the background, see AsyncChatGPT.prewarm.
+        """
+        for account in self.accounts:
+            account.chatgpt.prewarm()
+
+    @property
+    def clients(self) -> list[AsyncChatGPT]:
+        return [account.chatgpt for account in self.accounts]
+
+    def choose(self) -> Account:
+        """
+        Returns:
+            Account: The account the next new conversation goes to, if they're all cooling down
+            the one that's back the soonest.
+
+        Raises:
+            InvalidSessionToken: If none of the accounts can be used.
+        """
+        count = len(self.accounts)
+        # Rotated so ties go to the account after the last one chosen
+        rotated = [self.accounts[(self.next_index + i) % count] for i in range(count)]
+        now = time.monotonic()
+        available = [account for account in rotated if account.cooldown_until <= now]
+        if available:
+            chosen = (
+                min(available, key=lambda account: account.load)
+                if self.strategy == "least_loaded"
+                else available[0]
+            )
+        else:
+            chosen = min(rotated, key=lambda account: account.cooldown_until)
+            if chosen.cooldown_until == math.inf:
+                raise InvalidSessionToken
+        self.next_index = (self.accounts.index(chosen) + 1) % count
+        return chosen
+
+    def owner(self, conversation_id: str) -> Account:
+        fingerprint = self.owners.get(conversation_id)
+        for account in self.accounts:
+            if account.fingerprint == fingerprint:
+                return account
+        return self.accounts[0]
+
+    def create_new_conversation(
+        self, model: Optional[str] = "gpt-3.5"
+    ) -> AsyncConversation:
+        return self.choose().chatgpt.create_new_conversation(model)
+
+    def get_conversation(self, conversation_id: str) -> AsyncConversation:
+        """
+        Make an instance of the conversation on the account that created it.
+        """
+        return self.owner(conversation_id).chatgpt.get_conversation(conversation_id)
+
+    async def delete_conversation(self, conversation_id: str) -> dict:
+        return await self.owner(conversation_id).chatgpt.delete_conversation(conversation_id)
+
+    def pin(self, chatgpt: AsyncChatGPT, conversation_id: str) -> None:
+        """
+        Remember that chatgpt's account created the conversation, called by the client once the server names it.
+        """
+        for account in self.accounts:
+            if account.chatgpt is chatgpt:
+                self.owners[conversation_id] = account.fingerprint
+                return
+
+    def unpin(self, conversation_id: str) -> None:
+        """
+        Forget the account of a conversation, called by the client once it's deleted.
+        """
+        self.owners.pop(conversation_id, None)
+
+    def report_status(self, chatgpt: AsyncChatGPT, status_code: int, headers) -> None:
+        """
+        Cool down chatgpt's account if a conversation request was rate limited or its access token expired.
+
+        Args:
+            chatgpt (AsyncChatGPT): The client that sent the request.
+            status_code (int): The response's status code.
+            headers: The response's headers.
+        """
+        account = next(account for account in self.accounts if account.chatgpt is chatgpt)
+        now = time.monotonic()
+        if status_code == 429:
+            try:
+                cooldown = float(headers.get("retry-after"))
+            except (TypeError, ValueError):
+                cooldown = self.rate_limit_cooldown
+            account.cooldown_until = max(account.cooldown_until, now + cooldown)
+        elif status_code == 401 and account.refresh_task is None:
+            account.cooldown_until = max(account.cooldown_until, now + self.token_expired_cooldown)
+            account.refresh_task = asyncio.create_task(self.refresh(account))
+
+    async def refresh(self, account: Account) -> None:
+        try:
+            await account.chatgpt.load_auth_token()
+        except InvalidSessionToken:
+            # The session token expired too, only a new one will do
+            account.cooldown_until = math.inf
+        except Exception:
+            # Retried once the cooldown is over and it's rejected again
+            pass
+        else:
+            account.cooldown_until = 0.0
+        finally:
+            account.refresh_task = None
+
+    def load(self, state: dict) -> None:
+        """
+        Restore the pinned conversations and where the round robin was from to_dict.
+        """
+        self.owners.update(state.get("owners", {}))
+        self.next_index = state.get("next_index", 0) % len(self.accounts)
+
+    def to_dict(self) -> dict:
+        return {"owners": self.owners, "next_index": self.next_index}
@@ -1,11 +1,26 @@
 import asyncio
+import codecs
 import ctypes
 import inspect
 import json
+import time
 import uuid
 import re
-import websockets
+import warnings
+from websockets.exceptions import ConnectionClosed
+
+try:
+    # websockets >= 13 renamed extra_headers to additional_headers in its new client
+    from websockets.asyncio.client import connect as ws_connect
+
+    WS_HEADERS_ARGUMENT = "additional_headers"
+except ImportError:
+    from websockets import connect as ws_connect
+
+    WS_HEADERS_ARGUMENT = "extra_headers"
 import base64
+from collections import deque
+from contextlib import aclosing
 from typing import AsyncGenerator, Callable, Optional
 
 from curl_cffi.requests import AsyncSession
@@ -17,12 +32,36 @@ from .errors import (
     UnexpectedResponseError,
     InvalidModelName,
 )
+from .concurrency import (
+    ChunkQueue,
+    Race,
+    SharedStream,
+    TaskGraph,
+    TaskScope,
+    cancel_and_close,
+    resume,
+)
+from .hedging import HedgePolicy
+from .profiler import Profiler
+from .proxies import ProxiedSession, ProxyPool
+from .replay import Recorder, ReplayTransport
+from .timings import Timings
 from .utils import async_get_binary_path, get_model_slug
 
 # Constants
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36"
-CHATGPT_API = "https://chat.openai.com/backend-api/{}"
+CHATGPT_URL = "https://chat.openai.com"
+CHATGPT_API = f"{CHATGPT_URL}/backend-api/{{}}"
 BACKUP_ARKOSE_TOKEN_GENERATOR = "https://arkose-token-generator.zaieem.repl.co/token"
+# Prefetched tokens older than this are thrown away rather than risk sending an expired one
+PREFETCHED_TOKEN_TTL = 120
+# Conversations searched for one whose stream was cancelled before the server named it, it was only just created
+FIND_CONVERSATION_LIMIT = 5
+# Chunks of the server's response kept to show what it returned when a response can't be parsed
+SERVER_RESPONSE_TAIL_CHUNKS = 16
+# Characters a response has to reach before the tokens of its possible continuation are prefetched,
+# responses are only cut off with max_tokens after thousands of characters
+CONTINUATION_PREFETCH_LENGTH = 4000
 WS_REGISTER_URL = CHATGPT_API.format("register-websocket")
 
 MODELS = {
@@ -31,12 +70,77 @@ MODELS = {
 }
 
 
+class PrefetchedToken:
+    """
+    A token fetched in the background ahead of the request that will use it.
+    """
+
+    def __init__(self, coroutine):
+        self.task = asyncio.create_task(coroutine)
+        self.created = time.monotonic()
+
+    async def take(self) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: The token, or None if fetching it failed or it's gone stale.
+        """
+        if time.monotonic() - self.created > PREFETCHED_TOKEN_TTL:
+            self.cancel()
+            return None
+        try:
+            return await self.task
+        except Exception:
+            return None
+
+    def cancel(self) -> None:
+        self.task.cancel()
+
+
+class ChatEvent:
+    """
+    A chunk of an assistant response, content only holds the text added since the previous chunk.
+    """
+
+    __slots__ = ("content", "message_id", "parent_id", "conversation_id", "finish_reason")
+
+    def __init__(
+        self,
+        content: str,
+        message_id: str,
+        parent_id: Optional[str],
+        conversation_id: str,
+        finish_reason: Optional[str] = None,
+    ):
+        self.content = content
+        self.message_id = message_id
+        self.parent_id = parent_id
+        self.conversation_id = conversation_id
+        # The server's finish_details type e.g., "stop" or "max_tokens", None until the message is finished
+        self.finish_reason = finish_reason
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            dict: The event in the format yielded by AsyncConversation.chat.
+        """
+        return {
+            "content": self.content,
+            "message_id": self.message_id,
+            "parent_id": self.parent_id,
+            "conversation_id": self.conversation_id,
+        }
+
+
 class AsyncConversation:
     def __init__(self, chatgpt, conversation_id=None, model=None):
         self.chatgpt = chatgpt
         self.conversation_id = conversation_id
         self.parent_id = None
         self.model = model
+        self.prefetched_arkose_token: Optional[PrefetchedToken] = None
+        # Id of the first message sent on a new conversation, delete uses it to find the conversation
+        # when its stream was cancelled before the server named it
+        self.first_message_id: Optional[str] = None
 
     async def fetch_chat(self) -> dict:
         """
@@ -51,7 +155,7 @@ class AsyncConversation:
         if not self.conversation_id:
             return {}
 
-        url = CHATGPT_API.format(f"conversation/{self.conversation_id}")
+        url = self.chatgpt.api_url(f"conversation/{self.conversation_id}")
         response = await self.chatgpt.session.get(
             url=url, headers=self.chatgpt.build_request_headers()
         )
@@ -71,12 +175,16 @@ class AsyncConversation:
 
         return chat
 
-    async def chat(self, user_input: str) -> AsyncGenerator[dict, None]:
+    async def chat(
+        self, user_input: str, hedge: Optional[bool] = None
+    ) -> AsyncGenerator[dict, None]:
         """
         As the name implies, chat with ChatGPT.
+        Builds a dict per chunk for compatibility, stream and stream_text are lighter.
 
         Args:
             user_input (str): The user's input message.
+            hedge (Optional[bool]): Whether a late response may be hedged, only new conversations are hedged. Defaults to whether the client has a hedge_policy.
 
         Yields:
             dict: A dictionary representing assistant responses.
@@ -87,22 +195,140 @@ class AsyncConversation:
         Raises:
             UnexpectedResponseError: If the response is not a valid JSON object or if the response json is not in the expected format
         """
+        async with aclosing(self.stream(user_input, hedge)) as events:
+            async for event in events:
+                yield event.to_dict()
+
+    async def stream_text(
+        self, user_input: str, hedge: Optional[bool] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Chat yielding only the text added by each chunk of the response.
+        """
+        async with aclosing(self.stream(user_input, hedge)) as events:
+            async for event in events:
+                yield event.content
+
+    def stream(
+        self, user_input: str, hedge: Optional[bool] = None
+    ) -> AsyncGenerator[ChatEvent, None]:
+        """
+        Chat yielding a ChatEvent per chunk of the response.
+
+        Args:
+            user_input (str): The user's input message.
+            hedge (Optional[bool]): Whether a late response may be hedged, only new conversations are hedged. Defaults to whether the client has a hedge_policy.
+
+        Returns:
+            AsyncGenerator[ChatEvent, None]: The response's chunks.
+
+        Raises:
+            UnexpectedResponseError: If the response is not a valid JSON object or if the response json is not in the expected format
+        """
+        if self.conversation_id is None and self.chatgpt.single_flight:
+            return self.join_flight(user_input, hedge)
+        return self.open_response(user_input, hedge)
+
+    def open_response(
+        self, user_input: str, hedge: Optional[bool] = None
+    ) -> AsyncGenerator[ChatEvent, None]:
+        policy = self.chatgpt.hedge_policy
+        if policy is not None and hedge is not False:
+            return self.hedged_stream(user_input, policy)
+        return self.stream_message(user_input)
+
+    async def join_flight(
+        self, user_input: str, hedge: Optional[bool] = None
+    ) -> AsyncGenerator[ChatEvent, None]:
+        """
+        Attach to the response of the same message already streaming on a fresh conversation of the same model,
+        or send it and let later identical messages attach to this one's response. Every attached conversation
+        ends up on the conversation of the response that was actually sent.
+        """
+        flights = self.chatgpt.flights
+        key = (self.model, user_input)
+        if key in flights:
+            self.chatgpt.timings.requests_coalesced += 1
+            # The response's conversation belongs to the account that sent it
+            flight, self.chatgpt = flights[key]
+        else:
 
+            def land() -> None:
+                if flights.get(key, (None,))[0] is flight:
+                    del flights[key]
+
+            flight = SharedStream(self.open_response(user_input, hedge), land)
+            flights[key] = (flight, self.chatgpt)
+        last_event = None
+        async with aclosing(flight.subscribe()) as events:
+            async for event in events:
+                last_event = event
+                self.conversation_id = event.conversation_id
+                yield event
+        if last_event is not None:
+            self.parent_id = last_event.message_id
+
+    async def stream_message(self, user_input: str) -> AsyncGenerator[ChatEvent, None]:
         payload = await self.build_message_payload(user_input)
+        if self.conversation_id is None:
+            self.first_message_id = payload["messages"][0]["id"]
 
-        server_response = (
-            ""  # To store what the server returned for debugging in case of an error
-        )
+        timings = self.chatgpt.timings
+        # To store what the server returned for debugging in case of an error, only the tail is kept
+        # since every event repeats the whole message so far
+        server_response: deque[str] = deque(maxlen=SERVER_RESPONSE_TAIL_CHUNKS)
         error = None
+        # Live transports count chunks as they arrive, before the response queue joins them
+        counts_chunks = self.chatgpt.replay is not None
+        self.chatgpt.active_streams += 1
         try:
-            full_message = None
+            # Only the latest event is kept rather than the decoded JSON of the whole message
+            last_event = None
+            # Length of the response so far, every event carries the full message
+            response_length = 0
+            # The first chunk future and stream of the continuation of a response cut off with max_tokens,
+            # it's sent as soon as the cut off event arrives rather than once the cut off stream ends
+            continuation: Optional[tuple[asyncio.Future, AsyncGenerator]] = None
+            cut_off_at = None
+            response: Optional[AsyncGenerator] = None
+            # When the response being streamed sent its first chunk
+            streaming_since: Optional[float] = None
             while True:
-                response = self.send_message(payload=payload) if not self.chatgpt.websocket_mode else self.send_websocket_message(payload=payload)
+                request_start = timings.now()
+                is_first_chunk = True
+                tokens_prefetched = False
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                pending_line = ""
+                if continuation is None:
+                    response = self.open_stream(payload)
+                else:
+                    response = resume(*continuation)
+                    continuation = None
                 async for chunk in response:
-                    decoded_chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+                    if is_first_chunk:
+                        is_first_chunk = False
+                        streaming_since = timings.now()
+                        if cut_off_at is None:
+                            timings.add(
+                                "time_to_first_chunk",
+                                timings.mark("first_chunk", first_only=True)
+                                - request_start,
+                            )
+                        else:
+                            # How long the output paused between the cut off and its continuation
+                            timings.add("continuation_stall", timings.now() - cut_off_at)
+                    if counts_chunks:
+                        self.chatgpt.count_chunk(chunk)
+                    decoded_chunk = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
                     
-                    server_response += decoded_chunk
-                    for line in decoded_chunk.splitlines():
+                    server_response.append(decoded_chunk)
+                    # Chunks can end mid line so the trailing partial line is kept for the next chunk,
+                    # SSE events always end with a newline so nothing is left over once the stream ends
+                    lines = f"{pending_line}{decoded_chunk}".split("\n")
+                    pending_line = lines.pop()
+                    # Every event carries the whole message so far so only the newest one in the chunk is decoded,
+                    # a chunk holds several when the response queue joined them because this consumer fell behind
+                    for line in reversed(lines):
                         if not line.startswith("data: "):
                             continue
 
@@ -110,36 +336,154 @@ class AsyncConversation:
                         if not (decoded_json := self.decode_raw_json(raw_json_data)):
                             continue
 
-                        if (
-                            "message" in decoded_json
-                            and decoded_json["message"]["author"]["role"] == "assistant"
-                        ):
-                            processed_response = self.filter_response(decoded_json)
-                            if full_message:
-                                prev_resp_len = len(
-                                    full_message["message"]["content"]["parts"][0]
-                                )
-                                processed_response["content"] = processed_response[
-                                    "content"
-                                ][prev_resp_len::]
-
-                            yield processed_response
-                            full_message = decoded_json
-                self.conversation_id = full_message["conversation_id"]
-                self.parent_id = full_message["message"]["id"]
-                if (
-                    full_message["message"]["metadata"]["finish_details"]["type"]
-                    == "max_tokens"
-                ):
-                    payload = await self.build_message_continuation_payload()
-                else:
+                        message = decoded_json.get("message")
+                        if message is None or message["author"]["role"] != "assistant":
+                            continue
+                        content = message["content"]["parts"][0]
+                        metadata = message["metadata"]
+                        finish_details = metadata.get("finish_details")
+                        last_event = ChatEvent(
+                            content[response_length:],
+                            message["id"],
+                            metadata.get("parent_id"),
+                            decoded_json["conversation_id"],
+                            finish_details["type"] if finish_details else None,
+                        )
+                        response_length = len(content)
+                        # Known early so the conversation can be deleted if the stream gets cancelled
+                        self.name_conversation(last_event.conversation_id)
+                        if last_event.finish_reason == "max_tokens" and continuation is None:
+                            cut_off_at = timings.now()
+                            continuation = self.start_continuation(last_event)
+                        elif not tokens_prefetched and response_length >= CONTINUATION_PREFETCH_LENGTH:
+                            tokens_prefetched = True
+                            self.prefetch_tokens()
+
+                        yield last_event
+                        break
+                timings.mark("last_chunk")
+                if streaming_since is not None:
+                    timings.streaming_time += timings.now() - streaming_since
+                    streaming_since = None
+                self.conversation_id = last_event.conversation_id
+                self.parent_id = last_event.message_id
+                if continuation is None:
                     break
         except Exception as e:
             error = e
+        finally:
+            self.chatgpt.active_streams -= 1
+            if streaming_since is not None:
+                # Closed or failed midway, its chunks were counted so the time it streamed for is too
+                timings.streaming_time += timings.now() - streaming_since
+            # Closed right away rather than when it's garbage collected so a response that's cut short is aborted now
+            if response is not None:
+                await cancel_and_close(None, response)
+            # The stream was closed or failed before the continuation was streamed
+            if continuation is not None:
+                await cancel_and_close(*continuation)
 
         # raising the error outside the 'except' block to prevent the 'During handling of the above exception, another exception occurred' error
         if error is not None:
-            raise UnexpectedResponseError(error, server_response)
+            raise UnexpectedResponseError(error, "".join(server_response))
+
+    def start_continuation(
+        self, cut_off: ChatEvent
+    ) -> tuple[asyncio.Future, AsyncGenerator[bytes | str, None]]:
+        """
+        Send the request continuing a response cut off with max_tokens without waiting for the cut off stream to end.
+
+        Args:
+            cut_off (ChatEvent): The event whose finish_reason is "max_tokens".
+
+        Returns:
+            tuple[asyncio.Future, AsyncGenerator[bytes | str, None]]: The future of the continuation's first chunk and its stream, see resume.
+        """
+        self.conversation_id = cut_off.conversation_id
+        self.parent_id = cut_off.message_id
+        stream = self.continuation_stream()
+        return asyncio.ensure_future(anext(stream)), stream
+
+    async def continuation_stream(self) -> AsyncGenerator[bytes | str, None]:
+        payload = await self.build_message_continuation_payload()
+        async with aclosing(self.open_stream(payload)) as response:
+            async for chunk in response:
+                yield chunk
+
+    async def hedged_stream(
+        self, user_input: str, policy: HedgePolicy
+    ) -> AsyncGenerator[ChatEvent, None]:
+        """
+        Chat but if the first response is later than the policy allows send the same message on a fresh conversation too,
+        whichever responds first is kept and the other is cancelled and deleted.
+        """
+        timings = self.chatgpt.timings
+        start = timings.now()
+        is_new_conversation = self.conversation_id is None
+        primary = self.stream_message(user_input)
+        first = asyncio.ensure_future(anext(primary))
+        delay = policy.request() if is_new_conversation else None
+        try:
+            await asyncio.wait({first}, timeout=delay)
+        except BaseException:
+            # Cancelled before deciding whether to hedge, the request is still owned by nobody else
+            await cancel_and_close(first, primary)
+            raise
+        if first.done() or delay is None:
+            is_first_response = True
+            async with aclosing(resume(first, primary)) as events:
+                async for event in events:
+                    if is_first_response:
+                        is_first_response = False
+                        policy.observe(timings.now() - start)
+                    yield event
+            return
+
+        policy.hedged()
+        timings.add("hedge_delay", delay)
+        hedge_conversation = self.chatgpt.create_new_conversation(self.model)
+        race = Race(
+            [resume(first, primary), hedge_conversation.stream_message(user_input)]
+        )
+        is_first_response = True
+        try:
+            async with aclosing(aiter(race)) as events:
+                async for event in events:
+                    if is_first_response:
+                        is_first_response = False
+                        policy.observe(timings.now() - start)
+                    yield event
+        finally:
+            # The loser's conversation_id is unknown if it was cancelled before its first event,
+            # delete then finds the conversation by its first message
+            if race.winner == 1:
+                loser = AsyncConversation(self.chatgpt, self.conversation_id, self.model)
+                loser.first_message_id = self.first_message_id
+                self.conversation_id = hedge_conversation.conversation_id
+                self.parent_id = hedge_conversation.parent_id
+                self.first_message_id = hedge_conversation.first_message_id
+            else:
+                loser = hedge_conversation
+            try:
+                await loser.delete()
+            except Exception:
+                pass
+
+    def open_stream(self, payload: dict) -> AsyncGenerator[bytes | str, None]:
+        """
+        Send a message payload over the client's transport i.e., a replayed session, WebSocket or SSE.
+
+        Args:
+            payload (dict): Payload containing message information.
+
+        Returns:
+            AsyncGenerator[bytes | str, None]: The response's chunks.
+        """
+        if self.chatgpt.replay is not None:
+            return self.chatgpt.replay.send(payload)
+        if self.chatgpt.websocket_mode:
+            return self.send_websocket_message(payload)
+        return self.send_message(payload)
 
     async def send_message(self, payload: dict) -> AsyncGenerator[bytes, None]:
         """
@@ -151,35 +495,45 @@ class AsyncConversation:
         Yields:
             bytes: Chunk of data received as a response.
         """
-        response_queue = asyncio.Queue()
+        response_queue = self.chatgpt.create_response_queue("sse", payload)
 
         async def perform_request():
             def content_callback(chunk):
+                self.chatgpt.count_chunk(chunk)
                 response_queue.put_nowait(chunk)
 
-            url = CHATGPT_API.format("conversation")
+            url = self.chatgpt.api_url("conversation")
             
             headers = self.chatgpt.build_request_headers()
             # Add Chat Requirements Token
-            chat_requriments_token = await self.chatgpt.create_chat_requirements_token()
+            chat_requriments_token = await self.chatgpt.take_chat_requirements_token()
             if chat_requriments_token:
                 headers["openai-sentinel-chat-requirements-token"] = chat_requriments_token
 
-            await self.chatgpt.session.post(
-                url=url,
-                headers=headers,
-                json=payload,
-                content_callback=content_callback,
-            )
-            await response_queue.put(None)
-
-        asyncio.create_task(perform_request())
+            with self.chatgpt.timings.span("conversation_request"):
+                response = await self.chatgpt.session.post(
+                    url=url,
+                    headers=headers,
+                    json=payload,
+                    content_callback=content_callback,
+                )
+            self.chatgpt.check_conversation_response(response)
 
-        while True:
-            chunk = await response_queue.get()
-            if chunk is None:
-                break
-            yield chunk
+        try:
+            # Closing the scope aborts the transfer if the stream is closed early e.g., it lost a race or was cancelled,
+            # and waits for curl to take the handle back so its connection can be reused
+            async with TaskScope() as scope:
+                request_task = scope.start(perform_request())
+                # Ends the stream when the request fails too, the error is raised below instead of waiting forever
+                request_task.add_done_callback(lambda _: response_queue.put_nowait(None))
+                while True:
+                    chunk = await response_queue.get()
+                    if chunk is None:
+                        break
+                    yield chunk
+                await request_task
+        finally:
+            self.chatgpt.timings.chunks_coalesced += response_queue.coalesced
     
     async def send_websocket_message(self, payload: dict) -> AsyncGenerator[str, None]:
         """
@@ -193,24 +547,34 @@ class AsyncConversation:
         """
         await self.chatgpt.ensure_websocket()
 
-        response_queue = asyncio.Queue()
-        websocket_request_id = None
+        response_queue = self.chatgpt.create_response_queue("websocket", payload)
+        # Every id the queue is registered under, removed however the request ends
+        websocket_request_ids = set()
+        websocket_request_id = payload.get("websocket_request_id")
+        # Register before posting so frames that arrive before the post response aren't dropped
+        if websocket_request_id is not None:
+            self.chatgpt.ws_conversation_map[websocket_request_id] = response_queue
+            websocket_request_ids.add(websocket_request_id)
 
         async def perform_request():
-            nonlocal websocket_request_id
-            
-            url = CHATGPT_API.format("conversation")
+            url = self.chatgpt.api_url("conversation")
             headers = self.chatgpt.build_request_headers()
             # Add Chat Requirements Token
-            chat_requriments_token = await self.chatgpt.create_chat_requirements_token()
+            chat_requriments_token = await self.chatgpt.take_chat_requirements_token()
             if chat_requriments_token:
                 headers["openai-sentinel-chat-requirements-token"] = chat_requriments_token
 
-            response = (await self.chatgpt.session.post(
-                url=url,
-                headers=headers,
-                json=payload,
-            )).json()
+            with self.chatgpt.timings.span("conversation_request"):
+                response = await self.chatgpt.session.post(
+                    url=url,
+                    headers=headers,
+                    json=payload,
+                )
+            self.chatgpt.check_conversation_response(response)
+            response = response.json()
+            # Named by the post already, before the response's first frame
+            if conversation_id := response.get("conversation_id"):
+                self.name_conversation(conversation_id)
 
             websocket_request_id = response.get("websocket_request_id")
             
@@ -219,16 +583,28 @@ class AsyncConversation:
             
             if websocket_request_id not in self.chatgpt.ws_conversation_map:
                 self.chatgpt.ws_conversation_map[websocket_request_id] = response_queue
-            
-        asyncio.create_task(perform_request())
+                websocket_request_ids.add(websocket_request_id)
 
-        while True:
-            chunk = await response_queue.get()
-            if chunk is None:
-                break
-            yield chunk
+        def end_if_failed(task: asyncio.Task) -> None:
+            # Otherwise the listener ends the stream once the response's last frame arrives
+            if not task.cancelled() and task.exception() is not None:
+                response_queue.put_nowait(None)
 
-        del self.chatgpt.ws_conversation_map[websocket_request_id]
+        try:
+            async with TaskScope() as scope:
+                request_task = scope.start(perform_request())
+                request_task.add_done_callback(end_if_failed)
+                while True:
+                    chunk = await response_queue.get()
+                    if chunk is None:
+                        break
+                    yield chunk
+                await request_task
+        finally:
+            # Unsubscribed from the websocket once the post is aborted, later frames of the response are dropped
+            for websocket_request_id in websocket_request_ids:
+                self.chatgpt.ws_conversation_map.pop(websocket_request_id, None)
+            self.chatgpt.timings.chunks_coalesced += response_queue.coalesced
     
 
     async def build_message_payload(self, user_input: str) -> dict:
@@ -240,14 +616,15 @@ class AsyncConversation:
         """
         if self.conversation_id and (self.parent_id is None or self.model is None):
             await self.fetch_chat()  # it will automatically fetch the chat and set the parent id
+        # The transport and whether to send a websocket_request_id depend on it
+        await self.chatgpt.wait_for_startup("websocket_check")
 
         payload = {
             "conversation_mode": {"conversation_mode": {"kind": "primary_assistant"}},
             "conversation_id": self.conversation_id,
             "action": "next",
-            "arkose_token": await self.arkose_token_generator()
-            if self.chatgpt.generate_arkose_token
-            or MODELS[self.model]["needs_arkose_token"]
+            "arkose_token": await self.take_arkose_token()
+            if self.needs_arkose_token()
             else None,
             "force_paragen": False,
             "history_and_training_disabled": False,
@@ -280,9 +657,8 @@ class AsyncConversation:
         payload = {
             "conversation_mode": {"conversation_mode": {"kind": "primary_assistant"}},
             "action": "continue",
-            "arkose_token": await self.arkose_token_generator()
-            if self.chatgpt.generate_arkose_token
-            or MODELS[self.model]["needs_arkose_token"]
+            "arkose_token": await self.take_arkose_token()
+            if self.needs_arkose_token()
             else None,
             "conversation_id": self.conversation_id,
             "force_paragen": False,
@@ -290,53 +666,121 @@ class AsyncConversation:
             "model": MODELS[self.model]["slug"],
             "parent_message_id": self.parent_id,
             "timezone_offset_min": -300,
+            "websocket_request_id": str(uuid.uuid4())
+            if self.chatgpt.websocket_mode
+            else None,
         }
 
         return payload
 
-    async def arkose_token_generator(self) -> str:
+    def needs_arkose_token(self) -> bool:
+        return bool(
+            self.chatgpt.generate_arkose_token or MODELS[self.model]["needs_arkose_token"]
+        )
+
+    async def take_arkose_token(self) -> str:
         """
-        Generate an Arkose token.
+        Use the token fetched by prepare_next_message if there's one, otherwise generate one.
 
         Returns:
             str: Arkose token.
         """
-        if not self.chatgpt.tried_downloading_binary:
-            self.chatgpt.binary_path = await async_get_binary_path(self.chatgpt.session)
-
-            if self.chatgpt.binary_path:
-                self.chatgpt.arkose = ctypes.CDLL(self.chatgpt.binary_path)
-                self.chatgpt.arkose.GetToken.restype = ctypes.c_char_p
-
-            self.chatgpt.tried_downloading_binary = True
+        prefetched, self.prefetched_arkose_token = self.prefetched_arkose_token, None
+        if prefetched is not None and (token := await prefetched.take()):
+            return token
+        return await self.arkose_token_generator()
 
-        if self.chatgpt.binary_path:
+    async def prepare_next_message(self) -> None:
+        """
+        Start fetching what the next message needs i.e., the conversation head, arkose token,
+        chat requirements token and WebSocket, so it can be sent as soon as the user's input is ready.
+        Failures are ignored here and retried when the message is actually sent.
+        """
+        if self.chatgpt.replay is not None:
+            return
+        if self.conversation_id and (self.parent_id is None or self.model is None):
+            try:
+                await self.fetch_chat()
+            except Exception:
+                return
+        self.prefetch_tokens()
+        if self.chatgpt.websocket_mode:
             try:
-                result = self.chatgpt.arkose.GetToken()
-                return ctypes.string_at(result).decode("utf-8")
-            except:
+                await self.chatgpt.ensure_websocket()
+            except Exception:
                 pass
 
-        for _ in range(5):
-            response = await self.chatgpt.session.get(BACKUP_ARKOSE_TOKEN_GENERATOR)
-            if response.text == "null":
-                raise BackendError(error_code=505)
-            try:
-                return response.json()["token"]
-            except:
-                await asyncio.sleep(0.7)
+    def prefetch_tokens(self) -> None:
+        """
+        Start fetching the arkose and chat requirements tokens of the next request in the background.
+        """
+        if self.chatgpt.replay is not None:
+            return
+        if self.needs_arkose_token() and self.prefetched_arkose_token is None:
+            self.prefetched_arkose_token = PrefetchedToken(self.arkose_token_generator())
+        self.chatgpt.prefetch_chat_requirements_token()
 
-        raise RetryError(website=BACKUP_ARKOSE_TOKEN_GENERATOR)
+    def cancel_prefetch(self) -> None:
+        if self.prefetched_arkose_token is not None:
+            self.prefetched_arkose_token.cancel()
+            self.prefetched_arkose_token = None
+
+    async def arkose_token_generator(self) -> str:
+        """
+        Generate an Arkose token.
+
+        Returns:
+            str: Arkose token.
+        """
+        if self.chatgpt.replay is not None:
+            # The recorded payloads already carry their tokens
+            return ""
+        with self.chatgpt.timings.span("arkose_token_generator"):
+            if not self.chatgpt.tried_downloading_binary:
+                # Started in the background by __aenter__ when generate_arkose_token is set
+                await self.chatgpt.startup.step("arkose", self.chatgpt.load_arkose)
+
+            if self.chatgpt.binary_path:
+                try:
+                    result = self.chatgpt.arkose.GetToken()
+                    return ctypes.string_at(result).decode("utf-8")
+                except:
+                    pass
+
+            for _ in range(5):
+                response = await self.chatgpt.session.get(BACKUP_ARKOSE_TOKEN_GENERATOR)
+                if response.text == "null":
+                    raise BackendError(error_code=505)
+                try:
+                    return response.json()["token"]
+                except:
+                    await asyncio.sleep(0.7)
+
+            raise RetryError(website=BACKUP_ARKOSE_TOKEN_GENERATOR)
+
+    def name_conversation(self, conversation_id: str) -> None:
+        """
+        Take the id the server gave the new conversation, the first time it's seen.
+        """
+        if self.conversation_id is not None:
+            return
+        self.conversation_id = conversation_id
+        if self.chatgpt.account_pool is not None:
+            self.chatgpt.account_pool.pin(self.chatgpt, conversation_id)
 
     async def delete(self) -> None:
         """
         Deletes the conversation.
+        A new conversation whose first message was sent but whose id never arrived is looked up by that message.
         """
+        if not self.conversation_id and self.first_message_id:
+            self.conversation_id = await self.chatgpt.find_conversation(self.first_message_id)
         if self.conversation_id:
             await self.chatgpt.delete_conversation(self.conversation_id)
 
             self.conversation_id = None
             self.parent_id = None
+        self.first_message_id = None
 
     @staticmethod
     def decode_raw_json(raw_json_data: str) -> dict or bool:
@@ -355,8 +799,48 @@ class AsyncConversation:
         except:
             return False
 
+    @staticmethod
+    def drop_superseded_events(data: bytes | str) -> bytes | str:
+        """
+        Drop the lines of joined response chunks that come before the newest complete assistant event,
+        it repeats the message of the events before it and stream_message only decodes the newest.
+        The first line is kept since it may complete a line the consumer already has the start of.
+
+        Args:
+            data (bytes | str): Joined response chunks.
+
+        Returns:
+            bytes | str: data without the superseded lines.
+        """
+        newline = b"\n" if isinstance(data, bytes) else "\n"
+        event_prefix = b"data: {" if isinstance(data, bytes) else "data: {"
+        first_line_end = data.find(newline) + 1
+        # Anything after the last newline is an incomplete line
+        line_end = data.rfind(newline)
+        while line_end >= first_line_end:
+            line_start = data.rfind(newline, first_line_end - 1, line_end) + 1
+            line = data[line_start:line_end]
+            if line.startswith(event_prefix):
+                try:
+                    message = json.loads(line[6:]).get("message")
+                except ValueError:
+                    message = None
+                if message is not None and message["author"]["role"] == "assistant":
+                    return data[:first_line_end] + data[line_start:]
+            line_end = line_start - 1
+        return data
+
     @staticmethod
     def filter_response(response):
+        """
+        Deprecated, stream and stream_text parse the events into ChatEvent objects and ChatEvent.to_dict
+        gives this dict.
+        """
+        warnings.warn(
+            "filter_response is deprecated, use ChatEvent.to_dict instead",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         processed_response = {
             "content": response["message"]["content"]["parts"][0],
             "message_id": response["message"]["id"],
@@ -376,6 +860,15 @@ class AsyncChatGPT:
         auth_token: Optional[str] = None,
         generate_arkose_token: Optional[bool] = False,
         websocket_mode: Optional[bool] = False,
+        timings: Optional[Timings] = None,
+        base_url: str = CHATGPT_URL,
+        recorder: Optional[Recorder] = None,
+        replay: Optional[ReplayTransport] = None,
+        hedge_policy: Optional[HedgePolicy] = None,
+        max_queued_chunks=64,
+        coalesce_chunks=True,
+        proxy_pool: Optional[ProxyPool] = None,
+        single_flight=False,
     ):
         """
         Initializes an instance of the class.
@@ -387,8 +880,19 @@ class AsyncChatGPT:
             auth_token (Optional[str]): An authentication token. Defaults to None.
             generate_arkose_token (Optional[bool]): Toggle whether to generate and send arkose-token in the payload. Defaults to False.
             websocket_mode (Optional[bool]): Toggle whether to use WebSocket for chat. Defaults to False.
+            timings (Optional[Timings]): Where to record the latency breakdown. Defaults to a new Timings.
+            base_url (str): The ChatGPT server to talk to e.g., a local mock backend. Defaults to https://chat.openai.com.
+            recorder (Optional[Recorder]): Record the raw requests and responses of the session. Defaults to None.
+            replay (Optional[ReplayTransport]): Replay a recorded session instead of talking to the server. Defaults to None.
+            hedge_policy (Optional[HedgePolicy]): Send a duplicate request on a fresh conversation when a new conversation's first response is late. Defaults to None.
+            max_queued_chunks (int): Response chunks queued separately before they're joined, with or without coalescing. Defaults to 64.
+            coalesce_chunks (bool): Join the response chunks that arrived while the consumer was busy into one. Defaults to True.
+            proxy_pool (Optional[ProxyPool]): Send each request through the fastest healthy proxy of the pool instead of proxies, the WebSocket doesn't use it. Defaults to None.
+            single_flight (bool): Send a message once when several fresh conversations of the same model send it at the same time, they all get the one response. Defaults to False.
         """
         self.proxies = proxies
+        self.proxy_pool = proxy_pool
+        self.base_url = base_url.rstrip("/")
         self.exit_callback_function = exit_callback_function
 
         self.arkose = None
@@ -399,36 +903,92 @@ class AsyncChatGPT:
         self.session_token = session_token
         self.auth_token = auth_token
         self.session = None
+        self.prewarm_task: Optional[asyncio.Task] = None
+        # Steps of the client's initialization, see __aenter__
+        self.startup = TaskGraph()
         
         self.websocket_mode = websocket_mode
         self.ws_loop = None
+        self.websocket = None
         self.ws_conversation_map = {}
 
+        self.prefetched_chat_requirements_token: Optional[PrefetchedToken] = None
+
+        self.timings = timings if timings is not None else Timings()
+        self.profiler = None
+        self.recorder = recorder
+        self.replay = replay
+        self.hedge_policy = hedge_policy
+        self.max_queued_chunks = max_queued_chunks
+        self.coalesce_chunks = coalesce_chunks
+        # Responses streaming, an AccountPool gives new conversations to the account with the fewest
+        self.active_streams = 0
+        # Set by the AccountPool the client is one of the accounts of
+        self.account_pool = None
+        self.single_flight = single_flight
+        # (model, message) -> (response streaming for it, client that sent it), shared by an AccountPool's clients
+        self.flights: dict[tuple[str, str], tuple[SharedStream, AsyncChatGPT]] = {}
+
     async def __aenter__(self):
-        self.session = AsyncSession(
-            impersonate="chrome110", timeout=99999, proxies=self.proxies
-        )
+        self.profiler = Profiler.from_env()
+        if self.profiler is not None and not self.profiler.start():
+            self.profiler = None
+        self.create_session()
+        if self.replay is not None:
+            # Replayed sessions never touch the network
+            return self
+        if not self.auth_token and self.session_token is None:
+            raise TokenNotProvided
+
+        # Only the auth token is waited for here, the rest of the steps keep running in the background
+        # and are waited for by the first request that needs them
+        startup = self.startup
+        if self.prewarm_task is not None:
+            startup.add_task("prewarm", self.prewarm_task)
         if self.generate_arkose_token:
-            self.binary_path = await async_get_binary_path(self.session)
+            # Doesn't need the auth token
+            startup.step("arkose", self.load_arkose)
+        if not self.auth_token:
+            # Not after the prewarm, waiting for its round trip would add one when nothing ran alongside it.
+            # The warm connection is reused if it's ready by now, otherwise this request opens its own
+            startup.step("auth", self.load_auth_token)
+        startup.step("websocket_check", self.load_websocket_mode, depends_on=("auth",))
+        startup.step("websocket", self.open_websocket, depends_on=("websocket_check",))
+        try:
+            await self.wait_for_startup("auth")
+        except BaseException:
+            startup.cancel()
+            raise
 
-            if self.binary_path:
-                self.arkose = ctypes.CDLL(self.binary_path)
-                self.arkose.GetToken.restype = ctypes.c_char_p
+        return self
 
-            self.tried_downloading_binary = True
+    async def load_arkose(self) -> None:
+        self.binary_path = await async_get_binary_path(self.session)
 
-        if not self.auth_token:
-            if self.session_token is None:
-                raise TokenNotProvided
-            self.auth_token = await self.fetch_auth_token()
+        if self.binary_path:
+            self.arkose = ctypes.CDLL(self.binary_path)
+            self.arkose.GetToken.restype = ctypes.c_char_p
 
-        if not self.websocket_mode:
-           self.websocket_mode = await self.check_websocket_availability()
+        self.tried_downloading_binary = True
 
-        if self.websocket_mode:
-            await self.ensure_websocket()
+    async def load_auth_token(self) -> None:
+        self.auth_token = await self.fetch_auth_token()
 
-        return self
+    async def load_websocket_mode(self) -> None:
+        if not self.websocket_mode:
+            self.websocket_mode = await self.check_websocket_availability()
+
+    async def wait_for_startup(self, name: str) -> None:
+        """
+        Wait for the initialization step called name and the steps it depends on, then record the chain
+        of steps that held it up in the timings.
+        """
+        await self.startup.wait(name)
+        path = self.startup.critical_path(name)
+        times = self.startup.times
+        if name in times:
+            self.timings.critical_path = path
+            self.timings.critical_path_duration = times[name][1] - times[path[0]][0]
 
     async def __aexit__(self, *_):
         try:
@@ -436,7 +996,102 @@ class AsyncChatGPT:
                 if not inspect.iscoroutinefunction(self.exit_callback_function):
                     self.exit_callback_function(self)
         finally:
+            self.startup.cancel()
+            if self.prewarm_task is not None:
+                self.prewarm_task.cancel()
+            if self.prefetched_chat_requirements_token is not None:
+                self.prefetched_chat_requirements_token.cancel()
+            await self.close_websocket()
             self.session.close()
+            # So entering the client again starts over with a new session instead of the closed one
+            self.session = None
+            self.prewarm_task = None
+            self.startup = TaskGraph()
+            self.prefetched_chat_requirements_token = None
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.profiler is not None:
+                self.profiler.stop()
+
+    def create_session(self) -> AsyncSession:
+        if self.session is None:
+            self.session = AsyncSession(
+                impersonate="chrome110", timeout=99999, proxies=self.proxies
+            )
+            if self.proxy_pool is not None:
+                self.session = ProxiedSession(self.session, self.proxy_pool)
+        return self.session
+
+    def prewarm(self) -> asyncio.Task:
+        """
+        Start opening the connection to the server in the background i.e., DNS, TCP and TLS,
+        so the handshake overlaps with whatever is done before entering the client.
+        The connection is kept alive in the session and reused by the requests made on entering.
+
+        Returns:
+            asyncio.Task: The task opening the connection, it never raises.
+        """
+        if self.prewarm_task is None:
+            self.create_session()
+            self.prewarm_task = asyncio.create_task(self.open_connection())
+        return self.prewarm_task
+
+    async def open_connection(self) -> None:
+        if self.replay is not None:
+            return
+        with self.timings.span("prewarm"):
+            try:
+                await self.session.head(self.base_url, headers={"User-Agent": USER_AGENT})
+            except Exception:
+                # Whatever went wrong will come up again and be reported by the real requests
+                pass
+
+    def create_response_queue(self, transport: str, payload: dict) -> ChunkQueue:
+        """
+        Make the queue a request's response chunks are put into, recording them if a recorder is set.
+
+        Args:
+            transport (str): Either "sse" or "websocket".
+            payload (dict): The request's payload.
+
+        Returns:
+            ChunkQueue: The response queue.
+        """
+        if self.recorder is not None:
+            return self.recorder.queue(
+                transport,
+                payload,
+                self.max_queued_chunks,
+                self.coalesce_chunks,
+                AsyncConversation.drop_superseded_events,
+            )
+        return ChunkQueue(
+            self.max_queued_chunks,
+            self.coalesce_chunks,
+            AsyncConversation.drop_superseded_events,
+        )
+
+    def count_chunk(self, chunk: bytes | str) -> None:
+        self.timings.bytes_received += len(chunk)
+        # Every streamed event is a "data: " line, the JSON ones carry the message so far
+        self.timings.tokens += chunk.count(b"data: {" if isinstance(chunk, bytes) else "data: {")
+
+    def check_conversation_response(self, response) -> None:
+        # Lets the account pool cool the account down when it's rate limited or its access token expired
+        if self.account_pool is not None and response.status_code >= 400:
+            self.account_pool.report_status(self, response.status_code, response.headers)
+
+    def api_url(self, endpoint: str) -> str:
+        """
+        Build the url of a backend-api endpoint.
+
+        Args:
+            endpoint (str): The endpoint e.g., "conversation".
+
+        Returns:
+            str: The endpoint's url.
+        """
+        return f"{self.base_url}/backend-api/{endpoint}"
 
     def build_request_headers(self) -> dict:
         """
@@ -489,10 +1144,14 @@ class AsyncChatGPT:
         Returns:
             dict: Server response json.
         """
-        url = CHATGPT_API.format(f"conversation/{conversation_id}")
+        if self.replay is not None:
+            return {}
+        url = self.api_url(f"conversation/{conversation_id}")
         response = await self.session.patch(
             url=url, headers=self.build_request_headers(), json={"is_visible": False}
         )
+        if self.account_pool is not None:
+            self.account_pool.unpin(conversation_id)
 
         return response.json()
 
@@ -505,7 +1164,7 @@ class AsyncChatGPT:
 
         Returns: authentication token.
         """
-        url = "https://chat.openai.com/api/auth/session"
+        url = f"{self.base_url}/api/auth/session"
         cookies = {"__Secure-next-auth.session-token": self.session_token}
 
         headers = {
@@ -526,7 +1185,8 @@ class AsyncChatGPT:
             ),
         }
 
-        response = await self.session.get(url=url, headers=headers)
+        with self.timings.span("fetch_auth_token"):
+            response = await self.session.get(url=url, headers=headers)
         response_json = response.json()
 
         if "accessToken" in response_json:
@@ -555,13 +1215,64 @@ class AsyncChatGPT:
             "about_model_message": about_model,
             "enabled": enable_for_new_chats,
         }
-        url = CHATGPT_API.format("user_system_messages")
+        url = self.api_url("user_system_messages")
         response = await self.session.post(
             url=url, headers=self.build_request_headers(), json=data
         )
 
         return response.json()
 
+    async def fetch_conversation(self, conversation_id: str) -> dict:
+        """
+        Fetch a conversation as the API returns it, unlike AsyncConversation.fetch_chat nothing is updated.
+
+        Args:
+            conversation_id (str): The ID of the conversation to fetch.
+
+        Returns:
+            dict: The conversation including its full message mapping.
+
+        Raises:
+            UnexpectedResponseError: If the response isn't a conversation.
+        """
+        url = self.api_url(f"conversation/{conversation_id}")
+        response = await self.session.get(url=url, headers=self.build_request_headers())
+        try:
+            conversation = response.json()
+        except Exception as e:
+            raise UnexpectedResponseError(e, response.text)
+        if not isinstance(conversation, dict) or "mapping" not in conversation:
+            raise UnexpectedResponseError(
+                f"Failed to fetch conversation {conversation_id}", response.text
+            )
+        return conversation
+
+    async def find_conversation(self, message_id: str) -> Optional[str]:
+        """
+        Find which of the most recently updated conversations holds a message, for a new conversation
+        whose stream ended before the server named it.
+
+        Args:
+            message_id (str): The id the client gave the message.
+
+        Returns:
+            Optional[str]: The conversation's id, None if it isn't among the recent ones e.g., it was never created.
+        """
+        page = await self.retrieve_chats(limit=FIND_CONVERSATION_LIMIT)
+        items = page.get("items") if isinstance(page, dict) else None
+        if not items:
+            return None
+
+        async def holds_message(conversation_id: str) -> bool:
+            try:
+                conversation = await self.fetch_conversation(conversation_id)
+            except Exception:
+                return False
+            return message_id in conversation.get("mapping", {})
+
+        found = await asyncio.gather(*(holds_message(item["id"]) for item in items))
+        return next((item["id"] for item, holds in zip(items, found) if holds), None)
+
     async def retrieve_chats(
         self, offset: Optional[int] = 0, limit: Optional[int] = 28
     ) -> dict:
@@ -570,7 +1281,7 @@ class AsyncChatGPT:
             "limit": limit,
             "order": "updated",
         }
-        url = CHATGPT_API.format("conversations")
+        url = self.api_url("conversations")
         response = await self.session.get(
             url=url, params=params, headers=self.build_request_headers()
         )
@@ -584,10 +1295,11 @@ class AsyncChatGPT:
         Returns:
             bool: True if WebSocket is available, otherwise False.
         """
-        url = CHATGPT_API.format("accounts/check/v4-2023-04-27")
-        response = (await self.session.get(
-            url=url, headers=self.build_request_headers()
-        )).json()
+        url = self.api_url("accounts/check/v4-2023-04-27")
+        with self.timings.span("check_websocket_availability"):
+            response = (await self.session.get(
+                url=url, headers=self.build_request_headers()
+            )).json()
         
         if 'account_ordering' in response and 'accounts' in response:
             account_id = response['account_ordering'][0]
@@ -597,8 +1309,14 @@ class AsyncChatGPT:
         return False
     
     async def ensure_websocket(self):
-        if not self.ws_loop:
-            ws_url_rsp = (await self.session.post(WS_REGISTER_URL, headers=self.build_request_headers())).json()
+        await self.startup.step(
+            "websocket", self.open_websocket, depends_on=("websocket_check",)
+        )
+        await self.wait_for_startup("websocket")
+
+    async def open_websocket(self) -> None:
+        if self.websocket_mode and not self.ws_loop:
+            ws_url_rsp = (await self.session.post(self.api_url("register-websocket"), headers=self.build_request_headers())).json()
             ws_url = ws_url_rsp['wss_url']
             access_token = self.extract_access_token(ws_url)
             self.ws_loop = asyncio.create_task(self.listen_to_websocket(ws_url, access_token))
@@ -612,9 +1330,13 @@ class AsyncChatGPT:
         
     async def listen_to_websocket(self, ws_url: str, access_token: str):
         headers = {'Authorization': f'Bearer {access_token}'}
-        async with websockets.connect(ws_url, extra_headers=headers) as websocket:
+        async with ws_connect(ws_url, **{WS_HEADERS_ARGUMENT: headers}) as websocket:
+            self.websocket = websocket
             while True:
-                message = await websocket.recv()
+                try:
+                    message = await websocket.recv()
+                except ConnectionClosed:
+                    break
                 message_data = json.loads(message)
                 body_encoded = message_data.get("body", "")
                 ws_id = message_data.get("websocket_request_id", "")
@@ -625,10 +1347,36 @@ class AsyncChatGPT:
                 if 'title_generation' in decoded_body:
                     # skip
                     continue
+                self.count_chunk(decoded_body)
                 response_queue.put_nowait(decoded_body)
                 if '[DONE]' in decoded_body or '[ERROR]' in decoded_body:
                     await response_queue.put(None)
                     continue
+        # Wake up any consumer still waiting on a response that will never arrive
+        for response_queue in self.ws_conversation_map.values():
+            response_queue.put_nowait(None)
+
+    async def close_websocket(self) -> None:
+        """
+        Close the websocket and wait for the listener to finish.
+
+        Closing the socket is what wakes the listener up, so this takes as long as the close handshake
+        rather than polling for a stop flag.
+        """
+        ws_loop = self.ws_loop
+        if ws_loop is None:
+            return
+        self.ws_loop = None
+        if self.websocket is None:
+            # Still connecting so there is no socket to close yet
+            ws_loop.cancel()
+        else:
+            await self.websocket.close()
+        try:
+            await ws_loop
+        except (asyncio.CancelledError, ConnectionClosed):
+            pass
+        self.websocket = None
 
     async def create_chat_requirements_token(self):
         """
@@ -637,10 +1385,34 @@ class AsyncChatGPT:
         Returns:
             str: chat requirements token
         """
-        url = CHATGPT_API.format("sentinel/chat-requirements")
-        response = await self.session.post(
-            url=url, headers=self.build_request_headers()
-        )
+        url = self.api_url("sentinel/chat-requirements")
+        with self.timings.span("create_chat_requirements_token"):
+            response = await self.session.post(
+                url=url, headers=self.build_request_headers()
+            )
         body = response.json()
         token = body.get("token", None)
         return token
+
+    def prefetch_chat_requirements_token(self) -> None:
+        """
+        Start fetching the chat requirements token of the next message in the background.
+        """
+        if self.prefetched_chat_requirements_token is None:
+            self.prefetched_chat_requirements_token = PrefetchedToken(
+                self.create_chat_requirements_token()
+            )
+
+    async def take_chat_requirements_token(self):
+        """
+        Use the prefetched chat requirements token if there's one, otherwise get a new one.
+        Tokens are single use so the prefetched one is cleared.
+
+        Returns:
+            str: chat requirements token
+        """
+        prefetched = self.prefetched_chat_requirements_token
+        self.prefetched_chat_requirements_token = None
+        if prefetched is not None and (token := await prefetched.take()):
+            return token
+        return await self.create_chat_requirements_token()
@@ -0,0 +1,411 @@
+import asyncio
+import time
+from collections import deque
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Yielded by merge in place of an item when one of the streams finishes
+STREAM_END = object()
+
+
+class ChunkQueue:
+    """
+    A response's chunks waiting to be consumed, None marks the end of the response.
+
+    When coalescing, get returns every chunk that's waiting joined into one so a consumer that falls behind
+    handles fewer larger chunks, and once more than max_items are waiting they're joined into one so the queue
+    doesn't keep an item per chunk the transport received. Without coalescing chunks are returned one by one,
+    but once more than max_items are waiting the newest half are joined so the queue is bounded either way.
+    Only one consumer may wait on it.
+    """
+
+    def __init__(
+        self,
+        max_items=64,
+        coalesce=True,
+        compact: Optional[Callable[[T], T]] = None,
+    ):
+        """
+        Args:
+            max_items (int): Chunks kept separately before they're joined. Defaults to 64.
+            coalesce (bool): Join waiting chunks, otherwise every chunk is returned on its own. Defaults to True.
+            compact (Optional[Callable[[T], T]]): Drops what the consumer won't need from joined chunks. Defaults to None.
+        """
+        self.items: deque = deque()
+        self.max_items = max_items
+        self.coalesce = coalesce
+        self.compact = compact
+        self.getter: Optional[asyncio.Future] = None
+        # Chunks that were joined with another one
+        self.coalesced = 0
+
+    def join(self, chunks: list[T]) -> T:
+        self.coalesced += len(chunks) - 1
+        joined = chunks[0][:0].join(chunks)
+        return self.compact(joined) if self.compact is not None else joined
+
+    def put_nowait(self, item) -> None:
+        items = self.items
+        items.append(item)
+        if item is not None and len(items) > self.max_items:
+            if self.coalesce:
+                joined = self.join(list(items))
+                items.clear()
+                items.append(joined)
+            else:
+                # The newest half rather than just the new chunk so it's joined once per max_items / 2 chunks
+                newest = [items.pop() for _ in range(max(2, self.max_items // 2 + 1))]
+                items.append(self.join(newest[::-1]))
+        if self.getter is not None and not self.getter.done():
+            self.getter.set_result(None)
+
+    async def put(self, item) -> None:
+        # Never blocks, transports push chunks from callbacks that can't wait
+        self.put_nowait(item)
+
+    async def get(self):
+        items = self.items
+        while not items:
+            self.getter = asyncio.get_running_loop().create_future()
+            try:
+                await self.getter
+            finally:
+                self.getter = None
+        item = items.popleft()
+        if item is None or not self.coalesce or not items or items[0] is None:
+            return item
+        chunks = [item]
+        while items and items[0] is not None:
+            chunks.append(items.popleft())
+        return self.join(chunks)
+
+    def qsize(self) -> int:
+        return len(self.items)
+
+
+async def cancel_and_close(task: Optional[asyncio.Task], stream: AsyncIterator) -> None:
+    """
+    Cancel a pending __anext__ of stream then close it so that its cleanup e.g., aborting the request, runs.
+    """
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+class TaskScope:
+    """
+    Owns the tasks started with it so none outlives the code that started them, leaving the scope however it's left
+    cancels the ones still running and waits for them to finish e.g., for an aborted request to hand its connection back.
+    Unlike asyncio.TaskGroup a task that fails doesn't cancel the others or the task that entered the scope,
+    its error is raised wherever it's awaited.
+    """
+
+    def __init__(self):
+        self.tasks: list[asyncio.Task] = []
+
+    def start(self, coroutine: Awaitable[T]) -> "asyncio.Task[T]":
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.append(task)
+        return task
+
+    async def close(self) -> None:
+        """
+        Cancel the tasks that are still running and wait for them, their errors are dropped.
+        """
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            task.cancel()
+        # Also retrieves the errors of tasks that failed without being awaited so asyncio doesn't warn about them
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __aenter__(self) -> "TaskScope":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+
+class Race:
+    """
+    Iterates whichever of the streams yields first. Streams that fail before yielding drop out of the race,
+    if all of them fail the last error is raised.
+
+    The losers already sent their request, so rather than being cancelled right away they're left to run in the
+    background until their first item e.g., the event naming the conversation the server created for them, then closed.
+    Those that haven't yielded by the time the winner ends, or the race is closed, are cancelled
+    so a stuck loser never holds up the race.
+    """
+
+    def __init__(self, streams: list[AsyncIterator[T]]):
+        self.streams = streams
+        # Index of the winning stream once it's known
+        self.winner: Optional[int] = None
+
+    @staticmethod
+    async def settle(first: asyncio.Future, stream: AsyncIterator) -> None:
+        try:
+            await first
+        except (StopAsyncIteration, Exception):
+            pass
+        await cancel_and_close(None, stream)
+
+    async def __aiter__(self) -> AsyncGenerator[T, None]:
+        pending = {
+            asyncio.ensure_future(anext(stream)): index
+            for index, stream in enumerate(self.streams)
+        }
+        first_item = None
+        error: Optional[BaseException] = None
+        try:
+            while pending and self.winner is None:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    index = pending.pop(task)
+                    try:
+                        item = task.result()
+                    except StopAsyncIteration:
+                        continue
+                    except Exception as e:
+                        error = e
+                        continue
+                    if self.winner is None:
+                        self.winner, first_item = index, item
+                    else:
+                        # Lost the tie, it still has to be closed
+                        await cancel_and_close(None, self.streams[index])
+        except BaseException:
+            await asyncio.gather(
+                *(cancel_and_close(task, self.streams[i]) for task, i in pending.items())
+            )
+            raise
+        if self.winner is None:
+            if error is not None:
+                raise error
+            return
+        losers = TaskScope()
+        for task, index in pending.items():
+            losers.start(self.settle(task, self.streams[index]))
+        winner = self.streams[self.winner]
+        try:
+            yield first_item
+            async for item in winner:
+                yield item
+        finally:
+            await losers.close()
+            await cancel_and_close(None, winner)
+
+
+async def merge(streams: list[AsyncIterator[T]]) -> AsyncGenerator[tuple[int, T], None]:
+    """
+    Iterate the streams concurrently, yielding (index of the stream, item) as items arrive
+    and (index, STREAM_END) once a stream finishes. If a stream fails the rest are cancelled and the error is raised.
+    """
+    pending = {
+        asyncio.ensure_future(anext(stream)): index
+        for index, stream in enumerate(streams)
+    }
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Keep the streams' order when several items are ready at once
+            for task in sorted(done, key=lambda t: pending[t]):
+                index = pending.pop(task)
+                try:
+                    item = task.result()
+                except StopAsyncIteration:
+                    yield index, STREAM_END
+                    continue
+                pending[asyncio.ensure_future(anext(streams[index]))] = index
+                yield index, item
+    finally:
+        await asyncio.gather(
+            *(cancel_and_close(task, streams[i]) for task, i in pending.items())
+        )
+
+
+async def resume(first: asyncio.Future, stream: AsyncIterator[T]) -> AsyncGenerator[T, None]:
+    """
+    Continue a stream whose first __anext__ was already started as the future first.
+    """
+    try:
+        try:
+            item = await first
+        except StopAsyncIteration:
+            return
+        yield item
+        async for item in stream:
+            yield item
+    finally:
+        await cancel_and_close(first, stream)
+
+
+class SharedStream:
+    """
+    Fans one stream out to several subscribers, each one gets every item from the start however late it subscribed.
+    The stream is read by a task of its own so a slow subscriber doesn't hold up the others, and it's cancelled
+    and closed once every subscriber has gone. Items are kept until the SharedStream is dropped.
+    """
+
+    def __init__(self, source: AsyncIterator[T], on_done: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            source (AsyncIterator[T]): The stream.
+            on_done (Optional[Callable[[], None]]): Called once the stream has ended, failed or been cancelled. Defaults to None.
+        """
+        self.source = source
+        self.on_done = on_done
+        self.items: list[T] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        # Replaced every time it's set so waiting subscribers wake up once per change
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def finish(self) -> None:
+        on_done, self.on_done = self.on_done, None
+        if on_done is not None:
+            on_done()
+
+    async def pump(self) -> None:
+        try:
+            async for item in self.source:
+                self.items.append(item)
+                self.notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self.notify()
+            try:
+                await cancel_and_close(None, self.source)
+            finally:
+                self.finish()
+
+    async def subscribe(self) -> AsyncGenerator[T, None]:
+        """
+        Iterate the stream from its first item, the stream starts being read by the first subscriber.
+        """
+        self.subscribers += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self.pump())
+        index = 0
+        try:
+            while True:
+                if index < len(self.items):
+                    index += 1
+                    yield self.items[index - 1]
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self.changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                # Right away so nobody subscribes to a stream that's being cancelled
+                self.finish()
+                self.task.cancel()
+                # Only return once the stream is closed so its request was aborted by the time the last subscriber is gone
+                await asyncio.gather(self.task, return_exceptions=True)
+
+
+class TaskGraph:
+    """
+    Runs named steps as soon as the steps they depend on have finished so independent steps run concurrently.
+    A step only runs once, adding it again returns the task of the first time it was added.
+    """
+
+    def __init__(self):
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.dependencies: dict[str, tuple[str, ...]] = {}
+        # name -> (started, finished) in perf_counter seconds
+        self.times: dict[str, tuple[float, float]] = {}
+
+    def step(
+        self,
+        name: str,
+        function: Callable[[], Awaitable[T]],
+        depends_on: tuple[str, ...] = (),
+    ) -> "asyncio.Task[T]":
+        """
+        Start the step called name unless it was already started.
+
+        Args:
+            name (str): The step's name.
+            function (Callable[[], Awaitable[T]]): Makes the step's coroutine, only called once the dependencies are done.
+            depends_on (tuple[str, ...]): Names of the steps that must finish first, unknown names are ignored.
+
+        Returns:
+            asyncio.Task[T]: The step's task.
+        """
+        if (task := self.tasks.get(name)) is not None:
+            return task
+        dependencies = tuple(d for d in depends_on if d in self.tasks)
+        self.dependencies[name] = dependencies
+
+        async def run() -> T:
+            for dependency in dependencies:
+                await self.tasks[dependency]
+            start = time.perf_counter()
+            try:
+                return await function()
+            finally:
+                self.times[name] = (start, time.perf_counter())
+
+        return self.add_task(name, asyncio.create_task(run()))
+
+    def add_task(self, name: str, task: asyncio.Task) -> asyncio.Task:
+        """
+        Add a task that was started elsewhere as a step without dependencies.
+        """
+        start = time.perf_counter()
+        self.tasks[name] = task
+        self.dependencies.setdefault(name, ())
+        # Deferred steps may never be awaited, retrieving their error stops asyncio from warning about it
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        # Steps made with step() already recorded more accurate times from within the task
+        task.add_done_callback(
+            lambda _: self.times.setdefault(name, (start, time.perf_counter()))
+        )
+        return task
+
+    async def wait(self, *names: str) -> None:
+        """
+        Wait for the steps called names, steps that were never added are skipped.
+        """
+        for name in names:
+            if (task := self.tasks.get(name)) is not None:
+                await task
+
+    def critical_path(self, name: str) -> list[str]:
+        """
+        The chain of steps that held up the step called name, each one being the dependency that finished last.
+        """
+        path = [name]
+        while dependencies := [
+            d for d in self.dependencies.get(path[0], ()) if d in self.times
+        ]:
+            path.insert(0, max(dependencies, key=lambda d: self.times[d][1]))
+        return path
+
+    def cancel(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
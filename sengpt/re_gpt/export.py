@@ -0,0 +1,174 @@
+import asyncio
+import gzip
+import json
+import os
+from typing import AsyncGenerator, Optional
+
+from .errors import UnexpectedResponseError
+
+
+class ExportResult:
+    def __init__(self):
+        self.listed = 0
+        self.exported = 0
+        self.unchanged = 0
+        # conversation_id -> why it couldn't be exported
+        self.failed: dict[str, str] = {}
+
+    def __str__(self) -> str:
+        return f"{self.exported} exported, {self.unchanged} unchanged, {len(self.failed)} failed out of {self.listed} listed"
+
+
+class Exporter:
+    """
+    Exports an account's conversations to gzip compressed JSON lines, one conversation with its full mapping per line.
+
+    Conversations are fetched concurrently and a checkpoint of each exported conversation's update_time is kept
+    next to the export, so later runs only fetch the conversations that changed since and append them to the export
+    as a new gzip member. When a conversation appears more than once the last line is the most recent.
+    The conversations that failed to export are kept in the checkpoint too and fetched again by the next run,
+    listing alone wouldn't find them once it stops before reaching them.
+    """
+
+    def __init__(
+        self,
+        chatgpt,
+        path: str,
+        concurrency=8,
+        page_size=100,
+        retries=3,
+        account: Optional[str] = None,
+    ):
+        """
+        Args:
+            chatgpt (AsyncChatGPT): An entered client.
+            path (str): The export's file, the checkpoint is saved at path + ".checkpoint.json".
+            concurrency (int): Maximum number of conversations fetched at once. Defaults to 8.
+            page_size (int): Conversations listed per request. Defaults to 100.
+            retries (int): Attempts per conversation before it's reported as failed. Defaults to 3.
+            account (Optional[str]): Identifies the account when several export to the same path, each keeps
+                its own checkpoint at path + ".<account>.checkpoint.json". Defaults to None.
+        """
+        self.chatgpt = chatgpt
+        self.path = path
+        # Per account as a conversation can only be fetched, and retried, by the account that owns it
+        self.checkpoint_path = (
+            f"{path}.{account}.checkpoint.json" if account else f"{path}.checkpoint.json"
+        )
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.retries = retries
+        # conversation_id -> update_time of the exported version
+        self.checkpoint: dict[str, float] = {}
+        # conversation_id -> update_time it was listed with, for the conversations that failed to export
+        self.failed: dict[str, float] = {}
+        self.load_checkpoint()
+
+    def load_checkpoint(self) -> None:
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(checkpoint, dict):
+            return
+        if "exported" in checkpoint:
+            self.checkpoint = checkpoint["exported"]
+            self.failed = checkpoint.get("failed", {})
+        else:
+            # Checkpoints written before failed conversations were kept only map ids to update_time
+            self.checkpoint = checkpoint
+
+    def save_checkpoint(self) -> None:
+        # Written to a temporary file first so an interrupted run can't leave a corrupt checkpoint
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"exported": self.checkpoint, "failed": self.failed}, f)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    async def list_changed(
+        self, result: ExportResult
+    ) -> AsyncGenerator[tuple[str, float], None]:
+        """
+        Yield the id and update_time of the conversations that changed since the checkpoint,
+        then of the ones that failed in earlier runs and weren't listed.
+        Listing is ordered by update_time so it stops at the first page where nothing changed.
+        """
+        # Copied as workers remove the conversations that export from it while listing goes on
+        retry = dict(self.failed)
+        offset = 0
+        while True:
+            page = await self.chatgpt.retrieve_chats(offset=offset, limit=self.page_size)
+            items = page.get("items") if isinstance(page, dict) else None
+            if items is None:
+                raise UnexpectedResponseError("Failed to list conversations", page)
+            changed = 0
+            for item in items:
+                result.listed += 1
+                update_time = item.get("update_time")
+                # Listed again so it's fetched with its latest update_time
+                retry.pop(item["id"], None)
+                if self.checkpoint.get(item["id"]) == update_time:
+                    result.unchanged += 1
+                    continue
+                changed += 1
+                yield item["id"], update_time
+            offset += len(items)
+            total = page.get("total")
+            if not items or not changed or (total is not None and offset >= total):
+                break
+        for conversation_id, update_time in retry.items():
+            yield conversation_id, update_time
+
+    async def fetch(self, conversation_id: str) -> dict:
+        for attempt in range(self.retries - 1):
+            try:
+                return await self.chatgpt.fetch_conversation(conversation_id)
+            except Exception:
+                await asyncio.sleep(2**attempt)
+        return await self.chatgpt.fetch_conversation(conversation_id)
+
+    async def run(self) -> ExportResult:
+        result = ExportResult()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Bounded so listing can't run far ahead of fetching
+        queue: asyncio.Queue[Optional[tuple[str, float]]] = asyncio.Queue(
+            self.concurrency * 2
+        )
+
+        f = gzip.open(self.path, "at", encoding="utf-8")
+
+        async def worker() -> None:
+            while (item := await queue.get()) is not None:
+                conversation_id, update_time = item
+                try:
+                    conversation = await self.fetch(conversation_id)
+                except Exception as e:
+                    result.failed[conversation_id] = str(e)
+                    self.failed[conversation_id] = update_time
+                    continue
+                conversation.setdefault("conversation_id", conversation_id)
+                f.write(json.dumps(conversation, separators=(",", ":")))
+                f.write("\n")
+                self.checkpoint[conversation_id] = update_time
+                self.failed.pop(conversation_id, None)
+                result.exported += 1
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            async for item in self.list_changed(result):
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            f.close()
+            # Only after the export is closed so the checkpoint never covers lines that weren't written,
+            # an interrupted run keeps its progress
+            self.save_checkpoint()
+        return result
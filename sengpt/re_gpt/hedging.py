@@ -0,0 +1,83 @@
+import math
+from collections import deque
+from typing import Optional
+
+
+class HedgePolicy:
+    """
+    Decides when a duplicate request should be sent for a response whose first chunk is late.
+
+    A request is hedged once it has waited longer than the given percentile of the observed times to first chunk,
+    as long as the hedged requests stay under budget as a fraction of all requests so hedging can't double the load.
+    """
+
+    def __init__(
+        self,
+        percentile=0.95,
+        default_delay=3.0,
+        budget=0.1,
+        min_samples=20,
+        max_samples=200,
+    ):
+        """
+        Args:
+            percentile (float): Percentile of the observed times to first chunk after which a request is hedged. Defaults to 0.95.
+            default_delay (float): Seconds to wait before hedging until min_samples have been observed. Defaults to 3.0.
+            budget (float): Maximum fraction of requests that may be hedged. Defaults to 0.1.
+            min_samples (int): Samples needed before the percentile is used. Defaults to 20.
+            max_samples (int): Only the most recent max_samples are kept. Defaults to 200.
+        """
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.budget = budget
+        self.min_samples = min_samples
+        self.samples: deque[float] = deque(maxlen=max_samples)
+        self.requests = 0
+        self.hedges = 0
+
+    def observe(self, time_to_first_chunk: float) -> None:
+        self.samples.append(time_to_first_chunk)
+
+    def delay(self) -> float:
+        """
+        Returns:
+            float: Seconds to wait for the first chunk before hedging.
+        """
+        if len(self.samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)]
+
+    def request(self) -> Optional[float]:
+        """
+        Count a request that may be hedged.
+
+        Returns:
+            Optional[float]: Seconds to wait for the first chunk before hedging, None if the budget is spent.
+        """
+        self.requests += 1
+        if self.hedges >= self.budget * self.requests:
+            return None
+        return self.delay()
+
+    def hedged(self) -> None:
+        self.hedges += 1
+        # Decay the counts so the budget follows recent traffic when the state is persisted
+        if self.requests > 1000:
+            self.requests //= 2
+            self.hedges //= 2
+
+    def to_dict(self) -> dict:
+        return {
+            "samples": list(self.samples),
+            "requests": self.requests,
+            "hedges": self.hedges,
+        }
+
+    def load(self, state: dict) -> None:
+        """
+        Restore the samples and counts saved with to_dict e.g., from a previous run of the CLI.
+        """
+        self.samples.extend(float(s) for s in state.get("samples", []))
+        self.requests = int(state.get("requests", 0))
+        self.hedges = int(state.get("hedges", 0))
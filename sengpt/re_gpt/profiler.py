@@ -0,0 +1,160 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from typing import Optional
+
+# Set to a directory to profile every AsyncChatGPT session into it when using the library
+PROFILE_ENV_VAR = "SENGPT_PROFILE"
+# Set to 1 to also sample what blocks the event loop
+PROFILE_LOOP_ENV_VAR = "SENGPT_PROFILE_LOOP"
+
+
+class LoopSampler:
+    """
+    Samples the stack of the event loop's thread whenever the loop misses its heartbeat,
+    so that blocking calls e.g., glow_print, Config.dump or ctypes show up.
+    """
+
+    def __init__(self, interval=0.005, block_threshold=0.02):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.last_beat = time.perf_counter()
+        # Collapsed stack -> number of samples
+        self.samples: dict[str, int] = {}
+        self.stop_event = threading.Event()
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.loop_thread_id = threading.get_ident()
+
+    async def heartbeat(self) -> None:
+        while True:
+            self.last_beat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+
+    def watch(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            if time.perf_counter() - self.last_beat < self.block_threshold:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = ";".join(
+                f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}"
+                for f in traceback.extract_stack(frame)
+            )
+            self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def start(self) -> None:
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat_task = asyncio.get_running_loop().create_task(self.heartbeat())
+        self.watchdog = threading.Thread(
+            target=self.watch, name="re_gpt-loop-sampler", daemon=True
+        )
+        self.watchdog.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        if self.watchdog is not None:
+            self.watchdog.join()
+
+    def report(self) -> str:
+        lines = [
+            f"Event loop blocked for more than {self.block_threshold * 1000:.0f} ms, sampled every {self.interval * 1000:.0f} ms",
+            "",
+        ]
+        for stack, count in sorted(self.samples.items(), key=lambda s: -s[1]):
+            lines.append(f"~{count * self.interval * 1000:.0f} ms ({count} samples)")
+            lines.extend(f"    {frame}" for frame in reversed(stack.split(";")))
+            lines.append("")
+        return "\n".join(lines)
+
+
+class Profiler:
+    """
+    Captures a cProfile profile and tracemalloc allocations, and optionally samples the event loop,
+    then writes profile.pstats, allocations.txt and loop_blocking.txt into output_dir.
+    """
+
+    # Only one profiler can run at a time since cProfile and tracemalloc are process wide
+    active: Optional["Profiler"] = None
+
+    def __init__(self, output_dir: str, sample_loop=False, top_allocations=30):
+        self.output_dir = output_dir
+        self.sample_loop = sample_loop
+        self.top_allocations = top_allocations
+        self.profile = cProfile.Profile()
+        self.loop_sampler: Optional[LoopSampler] = None
+
+    @staticmethod
+    def from_env() -> Optional["Profiler"]:
+        output_dir = os.environ.get(PROFILE_ENV_VAR)
+        if not output_dir:
+            return None
+        return Profiler(
+            output_dir, sample_loop=os.environ.get(PROFILE_LOOP_ENV_VAR) == "1"
+        )
+
+    def start(self) -> bool:
+        """
+        Start profiling, must be called from within the event loop if sampling it.
+
+        Returns:
+            bool: False if another profiler is already running in which case this one does nothing.
+        """
+        if Profiler.active is not None:
+            return False
+        Profiler.active = self
+        tracemalloc.start(25)
+        if self.sample_loop:
+            self.loop_sampler = LoopSampler()
+            self.loop_sampler.start()
+        self.profile.enable()
+        return True
+
+    def stop(self) -> None:
+        if Profiler.active is not self:
+            return
+        self.profile.disable()
+        # Leave out the sampler's own allocations
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, __file__, all_frames=True),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            )
+        )
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if self.loop_sampler is not None:
+            self.loop_sampler.stop()
+        Profiler.active = None
+        self.write(snapshot, peak)
+
+    def write(self, snapshot: tracemalloc.Snapshot, peak: int) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.profile.dump_stats(os.path.join(self.output_dir, "profile.pstats"))
+        with open(os.path.join(self.output_dir, "profile.txt"), "w") as f:
+            stats = pstats.Stats(self.profile, stream=f)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+        with open(os.path.join(self.output_dir, "allocations.txt"), "w") as f:
+            f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n\n")
+            for stat in snapshot.statistics("traceback")[: self.top_allocations]:
+                f.write(f"{stat}\n")
+                f.writelines(f"    {line}\n" for line in stat.traceback.format())
+        if self.loop_sampler is not None:
+            with open(os.path.join(self.output_dir, "loop_blocking.txt"), "w") as f:
+                f.write(self.loop_sampler.report())
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        self.stop()
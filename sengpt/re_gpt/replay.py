@@ -0,0 +1,164 @@
+import asyncio
+import base64
+import json
+import os
+import time
+from typing import AsyncGenerator, Callable, Optional
+
+from .concurrency import ChunkQueue
+
+
+class Recorder:
+    """
+    Records the raw request payloads and timestamped response chunks of a session as JSON lines
+    so the session can later be fed back into AsyncConversation with ReplayTransport.
+    SSE chunks are stored as base64 and websocket frames as text.
+    """
+
+    def __init__(self, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(
+            output_dir, f"session-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+        )
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.exchange_count = 0
+
+    def write(self, record: dict) -> None:
+        self.file.write(json.dumps(record))
+        self.file.write("\n")
+
+    def queue(
+        self,
+        transport: str,
+        payload: dict,
+        max_items=64,
+        coalesce=True,
+        compact: Optional[Callable] = None,
+    ) -> "RecordingQueue":
+        """
+        Make the response queue of a request, chunks are recorded as they arrive rather than when they are consumed
+        so coalescing doesn't change the recording.
+
+        Args:
+            transport (str): Either "sse" or "websocket".
+            payload (dict): The request's payload.
+            max_items (int): See ChunkQueue. Defaults to 64.
+            coalesce (bool): See ChunkQueue. Defaults to True.
+            compact (Optional[Callable]): See ChunkQueue. Defaults to None.
+
+        Returns:
+            RecordingQueue: The response queue.
+        """
+        self.exchange_count += 1
+        self.write(
+            {
+                "type": "request",
+                "id": self.exchange_count,
+                "transport": transport,
+                "payload": payload,
+            }
+        )
+        return RecordingQueue(
+            self, self.exchange_count, max_items, coalesce, compact
+        )
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class RecordingQueue(ChunkQueue):
+    def __init__(
+        self,
+        recorder: Recorder,
+        exchange_id: int,
+        max_items=64,
+        coalesce=True,
+        compact: Optional[Callable] = None,
+    ):
+        super().__init__(max_items, coalesce, compact)
+        self.recorder = recorder
+        self.exchange_id = exchange_id
+        self.start = time.perf_counter()
+
+    def put_nowait(self, item) -> None:
+        record = {
+            "type": "chunk" if item is not None else "end",
+            "id": self.exchange_id,
+            "t": time.perf_counter() - self.start,
+        }
+        if isinstance(item, bytes):
+            record["data"] = base64.b64encode(item).decode()
+            record["encoding"] = "base64"
+        elif item is not None:
+            record["data"] = item
+        else:
+            self.recorder.file.flush()
+        self.recorder.write(record)
+        super().put_nowait(item)
+
+
+class Exchange:
+    def __init__(self, transport: str, payload: dict):
+        self.transport = transport
+        self.payload = payload
+        # (seconds since the request was sent, chunk)
+        self.chunks: list[tuple[float, bytes | str]] = []
+
+
+class ReplayTransport:
+    """
+    Feeds a session recorded by Recorder back into AsyncConversation, no network access is needed.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0):
+        """
+        Args:
+            path (str): The recorded session's file.
+            speed (Optional[float]): Playback speed relative to the recording, None or 0 replays as fast as possible. Defaults to 1.0.
+        """
+        self.path = path
+        self.speed = speed
+        self.exchanges = ReplayTransport.load(path)
+        self.next_exchange = 0
+
+    @staticmethod
+    def load(path: str) -> list[Exchange]:
+        # Concurrent requests interleave so records are matched to their request by id
+        exchanges: dict[int, Exchange] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "request":
+                    exchanges[record["id"]] = Exchange(
+                        record["transport"], record["payload"]
+                    )
+                elif record["type"] == "chunk":
+                    data = record["data"]
+                    if record.get("encoding") == "base64":
+                        data = base64.b64decode(data)
+                    exchanges[record["id"]].chunks.append((record["t"], data))
+        return list(exchanges.values())
+
+    async def send(self, payload: dict) -> AsyncGenerator[bytes | str, None]:
+        """
+        Replay the response to the next recorded request.
+
+        Args:
+            payload (dict): Payload of the request being replayed, only used for error messages.
+
+        Yields:
+            bytes | str: The recorded chunks.
+        """
+        if self.next_exchange >= len(self.exchanges):
+            raise IndexError(
+                f'"{self.path}" has no recorded response left for the "{payload.get("action")}" request'
+            )
+        exchange = self.exchanges[self.next_exchange]
+        self.next_exchange += 1
+        start = time.perf_counter()
+        for t, chunk in exchange.chunks:
+            if self.speed:
+                delay = start + t / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
@@ -0,0 +1,256 @@
+import gzip
+import json
+import sqlite3
+import time
+from typing import Iterable, Optional
+
+from .replay import ReplayTransport
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    update_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS indexed_messages (
+    message_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS indexed_messages_conversation_id ON indexed_messages(conversation_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    text,
+    role UNINDEXED,
+    conversation_id UNINDEXED,
+    message_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+class SearchHit:
+    def __init__(self, conversation_id: str, title: str, role: str, snippet: str):
+        self.conversation_id = conversation_id
+        self.title = title
+        self.role = role
+        self.snippet = snippet
+
+
+class SearchIndex:
+    """
+    A local SQLite FTS5 full text index of conversation messages, filled from exports, recorded sessions
+    or the turns of a running session.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def update_conversation(
+        self,
+        conversation_id: str,
+        title: str,
+        update_time: float,
+        messages: Iterable[tuple[str, str, str]],
+        replace=False,
+    ) -> bool:
+        """
+        Index a conversation's messages.
+
+        Args:
+            conversation_id (str): The conversation's ID.
+            title (str): The conversation's title, kept if the conversation is already indexed.
+            update_time (float): The server's update_time of the conversation, 0 if it isn't known e.g., for a turn
+                indexed as it happens. Only compared with update_times of the server, never with the local clock.
+            messages (Iterable[tuple[str, str, str]]): (message_id, role, text) of the messages, already indexed messages are skipped.
+            replace (bool): Drop the conversation's indexed messages first e.g., when indexing its full mapping. Defaults to False.
+
+        Returns:
+            bool: False if the conversation was already indexed at update_time so nothing changed.
+        """
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT update_time FROM conversations WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            if replace and row is not None and row[0] >= update_time:
+                return False
+            self.connection.execute(
+                """
+                INSERT INTO conversations VALUES (?, ?, ?)
+                ON CONFLICT (conversation_id) DO UPDATE SET
+                    update_time = MAX(update_time, excluded.update_time),
+                    title = CASE WHEN ? THEN excluded.title ELSE title END
+                """,
+                (conversation_id, title, update_time, replace),
+            )
+            if replace:
+                self.delete_messages(conversation_id)
+            for message_id, role, text in messages:
+                inserted = self.connection.execute(
+                    "INSERT OR IGNORE INTO indexed_messages VALUES (?, ?)",
+                    (message_id, conversation_id),
+                ).rowcount
+                if inserted:
+                    self.connection.execute(
+                        "INSERT INTO messages VALUES (?, ?, ?, ?)",
+                        (text, role, conversation_id, message_id),
+                    )
+        return True
+
+    def add_turn(
+        self,
+        conversation_id: str,
+        prompt: str,
+        response: str,
+        response_id: Optional[str] = None,
+    ) -> None:
+        """
+        Index a prompt and its response as they happen, a new conversation is titled after its first prompt.
+        """
+        response_id = response_id or f"{conversation_id}:{time.time()}"
+        self.update_conversation(
+            conversation_id,
+            prompt.strip().splitlines()[0][:80] if prompt.strip() else "New chat",
+            # Not the local time, it's always later than the server's so the full conversation would never be
+            # indexed from an export. The update_time already indexed, if any, is kept
+            0.0,
+            (
+                (f"{response_id}:prompt", "user", prompt),
+                (response_id, "assistant", response),
+            ),
+        )
+
+    def remove_conversation(self, conversation_id: str) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            )
+            self.delete_messages(conversation_id)
+
+    def delete_messages(self, conversation_id: str) -> None:
+        self.connection.execute(
+            "DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)
+        )
+        self.connection.execute(
+            "DELETE FROM indexed_messages WHERE conversation_id = ?", (conversation_id,)
+        )
+
+    def index_conversation(self, conversation: dict) -> bool:
+        """
+        Index a conversation as returned by AsyncChatGPT.fetch_conversation or written by Exporter.
+
+        Returns:
+            bool: False if it was already indexed at its update_time.
+        """
+        messages = []
+        for node_id, node in conversation.get("mapping", {}).items():
+            message = node.get("message") or {}
+            role = (message.get("author") or {}).get("role")
+            if role not in ("user", "assistant"):
+                continue
+            parts = (message.get("content") or {}).get("parts") or []
+            # Non text parts e.g., images are dicts
+            text = "\n".join(p for p in parts if isinstance(p, str)).strip()
+            if text:
+                messages.append((message.get("id", node_id), role, text))
+        return self.update_conversation(
+            conversation["conversation_id"],
+            conversation.get("title") or "New chat",
+            float(conversation.get("update_time") or 0),
+            messages,
+            replace=True,
+        )
+
+    def index_export(self, path: str) -> int:
+        """
+        Index an export written by Exporter.
+
+        Returns:
+            int: Number of conversations that were added or updated.
+        """
+        updated = 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                updated += self.index_conversation(json.loads(line))
+        return updated
+
+    def index_recording(self, path: str) -> int:
+        """
+        Index the turns of a session recorded with Recorder.
+
+        Returns:
+            int: Number of turns indexed.
+        """
+        turns = 0
+        for exchange in ReplayTransport.load(path):
+            if exchange.payload.get("action") != "next":
+                continue
+            prompt = exchange.payload["messages"][0]["content"]["parts"][0]
+            final_event = None
+            for _, chunk in exchange.chunks:
+                text = chunk.decode("utf-8", "replace") if isinstance(chunk, bytes) else chunk
+                for line in text.split("\n"):
+                    if not line.startswith("data: {"):
+                        continue
+                    try:
+                        event = json.loads(line[6:])
+                    except ValueError:
+                        # An event split across chunks, a later complete one carries the same content
+                        continue
+                    if (event.get("message") or {}).get("author", {}).get("role") == "assistant":
+                        final_event = event
+            if final_event is None:
+                continue
+            self.add_turn(
+                final_event["conversation_id"],
+                prompt,
+                final_event["message"]["content"]["parts"][0],
+                final_event["message"]["id"],
+            )
+            turns += 1
+        return turns
+
+    @staticmethod
+    def build_query(query: str) -> str:
+        # Every word is quoted so FTS5 operators and punctuation in the query can't cause syntax errors
+        words = query.split()
+        return " ".join(f'"{word.replace(chr(34), chr(34) * 2)}"' for word in words)
+
+    def search(self, query: str, limit=10) -> list[SearchHit]:
+        """
+        Find the messages containing every word in query, best matches first.
+        """
+        match = SearchIndex.build_query(query)
+        if not match:
+            return []
+        rows = self.connection.execute(
+            """
+            SELECT messages.conversation_id, conversations.title, messages.role,
+                   snippet(messages, 0, '[', ']', '...', 16)
+            FROM messages JOIN conversations USING (conversation_id)
+            WHERE messages MATCH ?
+            ORDER BY bm25(messages)
+            LIMIT ?
+            """,
+            (match, limit),
+        ).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def resolve_conversation_id(self, prefix: str) -> Optional[str]:
+        """
+        Expand a unique prefix of an indexed conversation's ID to the full ID.
+        """
+        rows = self.connection.execute(
+            "SELECT conversation_id FROM conversations WHERE conversation_id >= ? AND conversation_id < ? LIMIT 2",
+            (prefix, f"{prefix}\uffff"),
+        ).fetchall()
+        return rows[0][0] if len(rows) == 1 else None
@@ -1,27 +1,10 @@
-import ctypes
-import inspect
-import time
-import uuid
-import websockets
-from websockets.exceptions import ConnectionClosed
-import json
-import base64
 import asyncio
-from queue import Queue
-from threading import Thread
-from typing import Callable, Generator, Optional
-
-from curl_cffi.requests import Session
-
-from .async_chatgpt import (
-    BACKUP_ARKOSE_TOKEN_GENERATOR,
-    CHATGPT_API,
-    USER_AGENT,
-    AsyncChatGPT,
-    AsyncConversation,
-    MODELS,
-    WS_REGISTER_URL,
-)
+import functools
+import inspect
+from threading import Lock, Thread, current_thread
+from typing import AsyncGenerator, Callable, Coroutine, Generator, Optional, TypeVar
+
+from .async_chatgpt import CHATGPT_URL, AsyncChatGPT, AsyncConversation, ChatEvent
 from .errors import (
     BackendError,
     InvalidSessionToken,
@@ -30,12 +13,171 @@ from .errors import (
     UnexpectedResponseError,
     InvalidModelName,
 )
-from .utils import sync_get_binary_path, get_model_slug
 
+T = TypeVar("T")
+
+
+class EventLoopThread:
+    """
+    A long-lived asyncio event loop running in a daemon thread.
+
+    The sync API is a facade over the async client, every call is submitted to this loop
+    instead of spawning a thread per message.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(
+            target=self.loop.run_forever, name="re_gpt-event-loop", daemon=True
+        )
+        self.thread.start()
+
+    def run(self, coroutine: Coroutine[None, None, T]) -> T:
+        """
+        Run a coroutine on the loop and block until it completes. If waiting is interrupted e.g., by Ctrl+C,
+        the coroutine is cancelled and its cleanup is waited for before the interruption is raised.
+
+        Args:
+            coroutine (Coroutine): The coroutine to run.
+
+        Returns:
+            The coroutine's result.
+
+        Raises:
+            RuntimeError: If called from the loop's own thread e.g., by an exit callback, it would wait forever.
+        """
+        if current_thread() is self.thread:
+            coroutine.close()
+            raise RuntimeError(
+                "The sync API can't be used from its own event loop thread, await the async client instead"
+            )
+        task: Optional[asyncio.Task] = None
+
+        async def tracked() -> T:
+            nonlocal task
+            task = asyncio.current_task()
+            return await coroutine
+
+        future = asyncio.run_coroutine_threadsafe(tracked(), self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            if future.cancel() and task is not None:
+                # Otherwise it keeps running on the loop e.g., an async generator that can't be closed until it stops
+                self.run(asyncio.wait({task}))
+            raise
+
+    def iterate(self, generator: AsyncGenerator[T, None]) -> Generator[T, None, None]:
+        """
+        Drive an async generator on the loop from synchronous code.
+
+        Args:
+            generator (AsyncGenerator): The async generator to drive.
+
+        Yields:
+            The items produced by the async generator.
+        """
+        try:
+            while True:
+                try:
+                    item = self.run(generator.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            self.run(generator.aclose())
+
+
+_event_loop_thread: Optional[EventLoopThread] = None
+_event_loop_thread_lock = Lock()
+
+
+def get_event_loop_thread() -> EventLoopThread:
+    """
+    Get the process wide event loop thread shared by all sync clients, starting it if necessary.
+    """
+    global _event_loop_thread
+    with _event_loop_thread_lock:
+        if _event_loop_thread is None:
+            _event_loop_thread = EventLoopThread()
+        return _event_loop_thread
+
+
+def forward_inherited(async_class: type, target: str) -> Callable[[type], type]:
+    """
+    Give a sync facade the public methods of the async class it subclasses that it doesn't define itself,
+    each runs on the event loop thread against the wrapped async object. Coroutines they return are awaited
+    and async generators are iterated so the sync class keeps the async class's whole surface.
 
+    Args:
+        async_class (type): The async class the facade subclasses.
+        target (str): Name of the facade's attribute holding the async object.
+    """
+
+    def forwarder(name: str, function: Callable) -> Callable:
+        @functools.wraps(function)
+        def forward(self, *args, **kwargs):
+            loop_thread = self.loop_thread
+
+            async def call():
+                return getattr(getattr(self, target), name)(*args, **kwargs)
+
+            result = loop_thread.run(call())
+            if inspect.iscoroutine(result):
+                return loop_thread.run(result)
+            if inspect.isasyncgen(result):
+                return loop_thread.iterate(result)
+            return result
+
+        return forward
+
+    def decorate(cls: type) -> type:
+        for name, member in vars(async_class).items():
+            # Static methods don't touch the loop so they're inherited as they are
+            if name.startswith("_") or name in vars(cls) or not inspect.isfunction(member):
+                continue
+            setattr(cls, name, forwarder(name, member))
+        return cls
+
+    return decorate
+
+
+@forward_inherited(AsyncConversation, "async_conversation")
 class SyncConversation(AsyncConversation):
-    def __init__(self, chatgpt, conversation_id: Optional[str] = None, model=None):
-        super().__init__(chatgpt, conversation_id, model)
+    def __init__(self, chatgpt, async_conversation: AsyncConversation):
+        self.chatgpt = chatgpt
+        self.async_conversation = async_conversation
+        self.loop_thread = chatgpt.loop_thread
+
+    def __getattr__(self, name: str):
+        # Expose the async conversation's state e.g., prefetched_arkose_token
+        if name == "async_conversation":
+            raise AttributeError(name)
+        return getattr(self.async_conversation, name)
+
+    @property
+    def conversation_id(self) -> Optional[str]:
+        return self.async_conversation.conversation_id
+
+    @conversation_id.setter
+    def conversation_id(self, conversation_id: Optional[str]) -> None:
+        self.async_conversation.conversation_id = conversation_id
+
+    @property
+    def parent_id(self) -> Optional[str]:
+        return self.async_conversation.parent_id
+
+    @parent_id.setter
+    def parent_id(self, parent_id: Optional[str]) -> None:
+        self.async_conversation.parent_id = parent_id
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.async_conversation.model
+
+    @model.setter
+    def model(self, model: Optional[str]) -> None:
+        self.async_conversation.model = model
 
     def fetch_chat(self) -> dict:
         """
@@ -47,28 +189,7 @@ class SyncConversation(AsyncConversation):
         Raises:
             UnexpectedResponseError: If the response is not a valid JSON object or if the response json is not in the expected format
         """
-        if not self.conversation_id:
-            return {}
-
-        url = CHATGPT_API.format(f"conversation/{self.conversation_id}")
-        response = self.chatgpt.session.get(
-            url=url, headers=self.chatgpt.build_request_headers()
-        )
-
-        error = None
-        try:
-            chat = response.json()
-            self.parent_id = list(chat.get("mapping", {}))[-1]
-            model_slug = get_model_slug(chat)
-            self.model = [
-                key for key, value in MODELS.items() if value["slug"] == model_slug
-            ][0]
-        except Exception as e:
-            error = e
-        if error is not None:
-            raise UnexpectedResponseError(error, response.text)
-
-        return chat
+        return self.chatgpt.loop_thread.run(self.async_conversation.fetch_chat())
 
     def chat(self, user_input: str) -> Generator[dict, None, None]:
         """
@@ -86,59 +207,21 @@ class SyncConversation(AsyncConversation):
         Raises:
             UnexpectedResponseError: If the response is not a valid JSON object or if the response json is not in the expected format
         """
+        return self.chatgpt.loop_thread.iterate(self.async_conversation.chat(user_input))
 
-        payload = self.build_message_payload(user_input)
+    def stream(self, user_input: str) -> Generator[ChatEvent, None, None]:
+        """
+        Chat yielding a ChatEvent per chunk of the response.
+        """
+        return self.chatgpt.loop_thread.iterate(self.async_conversation.stream(user_input))
 
-        server_response = (
-            ""  # To store what the server returned for debugging in case of an error
+    def stream_text(self, user_input: str) -> Generator[str, None, None]:
+        """
+        Chat yielding only the text added by each chunk of the response.
+        """
+        return self.chatgpt.loop_thread.iterate(
+            self.async_conversation.stream_text(user_input)
         )
-        error = None
-        try:
-            full_message = None
-            while True:
-                response = self.send_message(payload=payload) if not self.chatgpt.websocket_mode else self.send_websocket_message(payload=payload)
-                for chunk in response:
-                    decoded_chunk = chunk.decode() if not self.chatgpt.websocket_mode else chunk
-
-                    server_response += decoded_chunk
-                    for line in decoded_chunk.splitlines():
-                        if not line.startswith("data: "):
-                            continue
-
-                        raw_json_data = line[6:]
-                        if not (decoded_json := self.decode_raw_json(raw_json_data)):
-                            continue
-
-                        if (
-                            "message" in decoded_json
-                            and decoded_json["message"]["author"]["role"] == "assistant"
-                        ):
-                            processed_response = self.filter_response(decoded_json)
-                            if full_message:
-                                prev_resp_len = len(
-                                    full_message["message"]["content"]["parts"][0]
-                                )
-                                processed_response["content"] = processed_response[
-                                    "content"
-                                ][prev_resp_len::]
-
-                            yield processed_response
-                            full_message = decoded_json
-                self.conversation_id = full_message["conversation_id"]
-                self.parent_id = full_message["message"]["id"]
-                if (
-                    full_message["message"]["metadata"]["finish_details"]["type"]
-                    == "max_tokens"
-                ):
-                    payload = self.build_message_continuation_payload()
-                else:
-                    break
-        except Exception as e:
-            error = e
-
-        # raising the error outside the 'except' block to prevent the 'During handling of the above exception, another exception occurred' error
-        if error is not None:
-            raise UnexpectedResponseError(error, server_response)
 
     def send_message(self, payload: dict) -> Generator[bytes, None, None]:
         """
@@ -150,35 +233,10 @@ class SyncConversation(AsyncConversation):
         Yields:
             bytes: Chunk of data received as a response.
         """
-        response_queue = Queue()
-
-        def perform_request():
-            def content_callback(chunk):
-                response_queue.put(chunk)
-
-            url = CHATGPT_API.format("conversation")
-            headers = self.chatgpt.build_request_headers()
-            # Add Chat Requirements Token
-            chat_requriments_token = self.chatgpt.create_chat_requirements_token()
-            if chat_requriments_token:
-                headers["openai-sentinel-chat-requirements-token"] = chat_requriments_token
-
-            response = self.chatgpt.session.post(
-                url=url,
-                headers=headers,
-                json=payload,
-                content_callback=content_callback,
-            )
-            response_queue.put(None)
-
-        Thread(target=perform_request).start()
+        return self.chatgpt.loop_thread.iterate(
+            self.async_conversation.send_message(payload)
+        )
 
-        while True:
-            chunk = response_queue.get()
-            if chunk is None:
-                break
-            yield chunk
-    
     def send_websocket_message(self, payload: dict) -> Generator[str, None, None]:
         """
         Send a message payload via WebSocket and receive the response.
@@ -189,43 +247,9 @@ class SyncConversation(AsyncConversation):
         Yields:
             str: Chunk of data received as a response.
         """
-
-        response_queue = Queue()
-        websocket_request_id = None
-
-        def perform_request():
-            nonlocal websocket_request_id
-            
-            url = CHATGPT_API.format("conversation")
-            headers = self.chatgpt.build_request_headers()
-            # Add Chat Requirements Token
-            chat_requriments_token = self.chatgpt.create_chat_requirements_token()
-            if chat_requriments_token:
-                headers["openai-sentinel-chat-requirements-token"] = chat_requriments_token
-
-            response = (self.chatgpt.session.post(
-                url=url,
-                headers=headers,
-                json=payload,
-            )).json()
-
-            websocket_request_id = response.get("websocket_request_id")
-            
-            if websocket_request_id is None:
-                raise UnexpectedResponseError("WebSocket request ID not found in response", response)
-
-            if websocket_request_id not in self.chatgpt.ws_conversation_map:
-                self.chatgpt.ws_conversation_map[websocket_request_id] = response_queue
-            
-        Thread(target=perform_request).start()
-
-        while True:
-            chunk = response_queue.get()
-            if chunk is None:
-                break
-            yield chunk
-
-        del self.chatgpt.ws_conversation_map[websocket_request_id]
+        return self.chatgpt.loop_thread.iterate(
+            self.async_conversation.send_websocket_message(payload)
+        )
 
     def build_message_payload(self, user_input: str) -> dict:
         """
@@ -234,37 +258,9 @@ class SyncConversation(AsyncConversation):
         Returns:
             dict: Payload containing message information.
         """
-        if self.conversation_id and (self.parent_id is None or self.model is None):
-            self.fetch_chat()  # it will automatically fetch the chat and set the parent id
-
-        payload = {
-            "conversation_mode": {"conversation_mode": {"kind": "primary_assistant"}},
-            "conversation_id": self.conversation_id,
-            "action": "next",
-            "arkose_token": self.arkose_token_generator()
-            if self.chatgpt.generate_arkose_token
-            or MODELS[self.model]["needs_arkose_token"]
-            else None,
-            "force_paragen": False,
-            "history_and_training_disabled": False,
-            "messages": [
-                {
-                    "author": {"role": "user"},
-                    "content": {"content_type": "text", "parts": [user_input]},
-                    "id": str(uuid.uuid4()),
-                    "metadata": {},
-                }
-            ],
-            "model": MODELS[self.model]["slug"],
-            "parent_message_id": str(uuid.uuid4())
-            if not self.parent_id
-            else self.parent_id,
-            "websocket_request_id": str(uuid.uuid4())
-            if self.chatgpt.websocket_mode
-            else None,
-        }
-
-        return payload
+        return self.chatgpt.loop_thread.run(
+            self.async_conversation.build_message_payload(user_input)
+        )
 
     def build_message_continuation_payload(self) -> dict:
         """
@@ -273,22 +269,9 @@ class SyncConversation(AsyncConversation):
         Returns:
             dict: Payload containing message information for continuation.
         """
-        payload = {
-            "conversation_mode": {"conversation_mode": {"kind": "primary_assistant"}},
-            "action": "continue",
-            "arkose_token": self.arkose_token_generator()
-            if self.chatgpt.generate_arkose_token
-            or MODELS[self.model]["needs_arkose_token"]
-            else None,
-            "conversation_id": self.conversation_id,
-            "force_paragen": False,
-            "history_and_training_disabled": False,
-            "model": MODELS[self.model]["slug"],
-            "parent_message_id": self.parent_id,
-            "timezone_offset_min": -300,
-        }
-
-        return payload
+        return self.chatgpt.loop_thread.run(
+            self.async_conversation.build_message_continuation_payload()
+        )
 
     def arkose_token_generator(self) -> str:
         """
@@ -297,44 +280,21 @@ class SyncConversation(AsyncConversation):
         Returns:
             str: Arkose token.
         """
-        if not self.chatgpt.tried_downloading_binary:
-            self.chatgpt.binary_path = sync_get_binary_path(self.chatgpt.session)
-
-            if self.chatgpt.binary_path:
-                self.chatgpt.arkose = ctypes.CDLL(self.chatgpt.binary_path)
-                self.chatgpt.arkose.GetToken.restype = ctypes.c_char_p
-
-            self.chatgpt.tried_downloading_binary = True
-
-        if self.chatgpt.binary_path:
-            try:
-                result = self.chatgpt.arkose.GetToken()
-                return ctypes.string_at(result).decode("utf-8")
-            except:
-                pass
-
-        for _ in range(5):
-            response = self.chatgpt.session.get(BACKUP_ARKOSE_TOKEN_GENERATOR)
-            if response.text == "null":
-                raise BackendError(error_code=505)
-            try:
-                return response.json()["token"]
-            except:
-                time.sleep(0.7)
-
-        raise RetryError(website=BACKUP_ARKOSE_TOKEN_GENERATOR)
+        return self.chatgpt.loop_thread.run(
+            self.async_conversation.arkose_token_generator()
+        )
 
     def delete(self) -> None:
         """
         Deletes the conversation.
         """
-        if self.conversation_id:
-            self.chatgpt.delete_conversation(self.conversation_id)
+        self.chatgpt.loop_thread.run(self.async_conversation.delete())
 
-            self.conversation_id = None
-            self.parent_id = None
+    decode_raw_json = staticmethod(AsyncConversation.decode_raw_json)
+    filter_response = staticmethod(AsyncConversation.filter_response)
 
 
+@forward_inherited(AsyncChatGPT, "async_chatgpt")
 class SyncChatGPT(AsyncChatGPT):
     def __init__(
         self,
@@ -343,6 +303,8 @@ class SyncChatGPT(AsyncChatGPT):
         exit_callback_function: Optional[Callable] = None,
         auth_token: Optional[str] = None,
         websocket_mode: Optional[bool] = False,
+        generate_arkose_token: Optional[bool] = False,
+        base_url: str = CHATGPT_URL,
     ):
         """
         Initializes an instance of the class.
@@ -353,47 +315,29 @@ class SyncChatGPT(AsyncChatGPT):
             exit_callback_function (Optional[callable]): A function to be called on exit. Defaults to None.
             auth_token (Optional[str]): An authentication token. Defaults to None.
             websocket_mode (Optional[bool]): Toggle whether to use WebSocket for chat. Defaults to False.
+            generate_arkose_token (Optional[bool]): Toggle whether to generate and send arkose-token in the payload. Defaults to False.
+            base_url (str): The ChatGPT server to talk to e.g., a local mock backend. Defaults to https://chat.openai.com.
         """
-        super().__init__(
+        self.exit_callback_function = exit_callback_function
+        # The exit callback is called by the facade so that it receives the sync client
+        self.async_chatgpt = AsyncChatGPT(
             proxies=proxies,
             session_token=session_token,
-            exit_callback_function=exit_callback_function,
             auth_token=auth_token,
+            generate_arkose_token=generate_arkose_token,
             websocket_mode=websocket_mode,
+            base_url=base_url,
         )
+        self.loop_thread = get_event_loop_thread()
 
-        self.stop_websocket_flag = False
-        self.stop_websocket = None
+    def __getattr__(self, name: str):
+        # Expose the async client's state e.g., auth_token, websocket_mode, session
+        if name == "async_chatgpt":
+            raise AttributeError(name)
+        return getattr(self.async_chatgpt, name)
 
     def __enter__(self):
-        self.session = Session(
-            impersonate="chrome110", timeout=99999, proxies=self.proxies
-        )
-
-        if self.generate_arkose_token:
-            self.binary_path = sync_get_binary_path(self.session)
-
-            if self.binary_path:
-                self.arkose = ctypes.CDLL(self.binary_path)
-                self.arkose.GetToken.restype = ctypes.c_char_p
-
-            self.tried_downloading_binary = True
-
-        if not self.auth_token:
-            if self.session_token is None:
-                raise TokenNotProvided
-            self.auth_token = self.fetch_auth_token()
-            
-        # automaticly check the status of websocket_mode
-        if not self.websocket_mode:
-            self.websocket_mode = self.check_websocket_availability()
-            
-        if self.websocket_mode:
-            def run_websocket():
-                asyncio.run(self.ensure_websocket())
-            self.ws_loop = Thread(target=run_websocket)
-            self.ws_loop.start()
-
+        self.loop_thread.run(self.async_chatgpt.__aenter__())
         return self
 
     def __exit__(self, *args):
@@ -402,11 +346,7 @@ class SyncChatGPT(AsyncChatGPT):
                 if not inspect.iscoroutinefunction(self.exit_callback_function):
                     self.exit_callback_function(self)
         finally:
-            self.session.close()
-
-        if self.websocket_mode:
-            self.stop_websocket_flag = True
-            self.ws_loop.join()
+            self.loop_thread.run(self.async_chatgpt.__aexit__(*args))
 
     def get_conversation(self, conversation_id: str) -> SyncConversation:
         """
@@ -419,14 +359,16 @@ class SyncChatGPT(AsyncChatGPT):
             Conversation: Conversation object.
         """
 
-        return SyncConversation(self, conversation_id)
+        return SyncConversation(
+            self, self.async_chatgpt.get_conversation(conversation_id)
+        )
 
     def create_new_conversation(
         self, model: Optional[str] = "gpt-3.5"
     ) -> SyncConversation:
-        if model not in MODELS:
-            raise InvalidModelName(model, MODELS)
-        return SyncConversation(self, model=model)
+        return SyncConversation(
+            self, self.async_chatgpt.create_new_conversation(model=model)
+        )
 
     def delete_conversation(self, conversation_id: str) -> dict:
         """
@@ -438,13 +380,10 @@ class SyncChatGPT(AsyncChatGPT):
         Returns:
             dict: Server response json.
         """
-        url = CHATGPT_API.format(f"conversation/{conversation_id}")
-        response = self.session.patch(
-            url=url, headers=self.build_request_headers(), json={"is_visible": False}
+        return self.loop_thread.run(
+            self.async_chatgpt.delete_conversation(conversation_id)
         )
 
-        return response.json()
-
     def fetch_auth_token(self) -> str:
         """
         Fetch the authentication token for the session.
@@ -454,34 +393,7 @@ class SyncChatGPT(AsyncChatGPT):
 
         Returns: authentication token.
         """
-        url = "https://chat.openai.com/api/auth/session"
-        cookies = {"__Secure-next-auth.session-token": self.session_token}
-
-        headers = {
-            "User-Agent": USER_AGENT,
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Alt-Used": "chat.openai.com",
-            "Connection": "keep-alive",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-            "Sec-GPC": "1",
-            "Cookie": "; ".join(
-                [
-                    f"{cookie_key}={cookie_value}"
-                    for cookie_key, cookie_value in cookies.items()
-                ]
-            ),
-        }
-
-        response = self.session.get(url=url, headers=headers)
-        response_json = response.json()
-
-        if "accessToken" in response_json:
-            return response_json["accessToken"]
-
-        raise InvalidSessionToken
+        return self.loop_thread.run(self.async_chatgpt.fetch_auth_token())
 
     def set_custom_instructions(
         self,
@@ -499,33 +411,17 @@ class SyncChatGPT(AsyncChatGPT):
         Returns:
             dict: Server response json.
         """
-        data = {
-            "about_user_message": about_user,
-            "about_model_message": about_model,
-            "enabled": enable_for_new_chats,
-        }
-        url = CHATGPT_API.format("user_system_messages")
-        response = self.session.post(
-            url=url, headers=self.build_request_headers(), json=data
+        return self.loop_thread.run(
+            self.async_chatgpt.set_custom_instructions(
+                about_user, about_model, enable_for_new_chats
+            )
         )
 
-        return response.json()
-
     def retrieve_chats(
         self, offset: Optional[int] = 0, limit: Optional[int] = 28
     ) -> dict:
-        params = {
-            "offset": offset,
-            "limit": limit,
-            "order": "updated",
-        }
-        url = CHATGPT_API.format("conversations")
-        response = self.session.get(
-            url=url, params=params, headers=self.build_request_headers()
-        )
+        return self.loop_thread.run(self.async_chatgpt.retrieve_chats(offset, limit))
 
-        return response.json()
-    
     def check_websocket_availability(self) -> bool:
         """
         Check if WebSocket is available.
@@ -533,56 +429,7 @@ class SyncChatGPT(AsyncChatGPT):
         Returns:
             bool: True if WebSocket is available, otherwise False.
         """
-        url = CHATGPT_API.format("accounts/check/v4-2023-04-27")
-        response = (self.session.get(
-            url=url, headers=self.build_request_headers()
-        )).json()
-        
-        if 'account_ordering' in response and 'accounts' in response:
-            account_id = response['account_ordering'][0]
-            if account_id in response['accounts']:
-                return 'shared_websocket' in response['accounts'][account_id]['features']
-
-        return False
-    
-    async def ensure_websocket(self):
-        ws_url_rsp = self.session.post(WS_REGISTER_URL, headers=self.build_request_headers()).json()
-        ws_url = ws_url_rsp['wss_url']
-        access_token = self.extract_access_token(ws_url)
-        asyncio.create_task(self.ensure_close_websocket())
-        await self.listen_to_websocket(ws_url, access_token)
-        
-    async def ensure_close_websocket(self):
-        while True:
-            if self.stop_websocket_flag:
-                break
-            await asyncio.sleep(1)
-        await self.stop_websocket()
-
-    async def listen_to_websocket(self, ws_url: str, access_token: str):
-        headers = {'Authorization': f'Bearer {access_token}'}
-        async with websockets.connect(ws_url, extra_headers=headers) as websocket:
-            async def stop_websocket():
-                await websocket.close()
-            self.stop_websocket = stop_websocket
-
-            while True:
-                message = None
-                try:
-                    message = await websocket.recv()
-                except ConnectionClosed:
-                    break
-                message_data = json.loads(message)
-                body_encoded = message_data.get("body", "")
-                ws_id = message_data.get("websocket_request_id", "")
-                decoded_body = base64.b64decode(body_encoded).decode('utf-8')
-                response_queue = self.ws_conversation_map.get(ws_id)
-                if response_queue is None:
-                    continue
-                response_queue.put_nowait(decoded_body)
-                if '[DONE]' in decoded_body or '[ERROR]' in decoded_body:
-                    response_queue.put(None)
-                    continue
+        return self.loop_thread.run(self.async_chatgpt.check_websocket_availability())
 
     def create_chat_requirements_token(self):
         """
@@ -591,10 +438,4 @@ class SyncChatGPT(AsyncChatGPT):
         Returns:
             str: chat requirements token
         """
-        url = CHATGPT_API.format("sentinel/chat-requirements")
-        response = self.session.post(
-            url=url, headers=self.build_request_headers()
-        )
-        body = response.json()
-        token = body.get("token", None)
-        return token
\ No newline at end of file
+        return self.loop_thread.run(self.async_chatgpt.create_chat_requirements_token())
@@ -0,0 +1,132 @@
+import json
+import time
+from contextlib import contextmanager
+from typing import Generator, Optional
+
+
+class Timings:
+    """
+    Collects named spans and streaming counters for a client so slow invocations can be broken down.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        # name -> [count, total seconds]
+        self.spans: dict[str, list] = {}
+        # name -> seconds since origin
+        self.marks: dict[str, float] = {}
+        self.bytes_received = 0
+        self.tokens = 0
+        # Seconds responses spent streaming from their first chunk to their last, summed over the responses
+        # so the time between them e.g., the user typing the next prompt, doesn't count
+        self.streaming_time = 0.0
+        # Response chunks joined with others because the consumer fell behind
+        self.chunks_coalesced = 0
+        # Messages that got the response of an identical one already streaming instead of being sent
+        self.requests_coalesced = 0
+        # Steps of the slowest chain the client waited on before it could send a request
+        self.critical_path: list[str] = []
+        self.critical_path_duration = 0.0
+
+    def now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def add(self, name: str, duration: float) -> None:
+        """
+        Add a duration to the span called name.
+
+        Args:
+            name (str): The span's name.
+            duration (float): Duration in seconds.
+        """
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [1, duration]
+            return
+        span[0] += 1
+        span[1] += duration
+
+    @contextmanager
+    def span(self, name: str) -> Generator[None, None, None]:
+        """
+        Time the enclosed block, works around awaits too.
+
+        Args:
+            name (str): The span's name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def mark(self, name: str, first_only=False) -> float:
+        """
+        Record the current time under name.
+
+        Args:
+            name (str): The mark's name.
+            first_only (bool): Keep the earliest time if the mark was already recorded. Defaults to False.
+
+        Returns:
+            float: The current time in seconds since the timings were created.
+        """
+        now = self.now()
+        if not (first_only and name in self.marks):
+            self.marks[name] = now
+        return now
+
+    def tokens_per_second(self) -> Optional[float]:
+        if self.streaming_time <= 0:
+            return None
+        return self.tokens / self.streaming_time
+
+    def to_dict(self) -> dict:
+        tokens_per_second = self.tokens_per_second()
+        return {
+            "spans": {
+                name: {"count": count, "total_ms": round(total * 1000, 3)}
+                for name, (count, total) in self.spans.items()
+            },
+            "marks_ms": {
+                name: round(value * 1000, 3) for name, value in self.marks.items()
+            },
+            "critical_path": self.critical_path,
+            "critical_path_ms": round(self.critical_path_duration * 1000, 3),
+            "bytes_received": self.bytes_received,
+            "tokens": self.tokens,
+            "streaming_ms": round(self.streaming_time * 1000, 3),
+            "chunks_coalesced": self.chunks_coalesced,
+            "requests_coalesced": self.requests_coalesced,
+            "tokens_per_second": round(tokens_per_second, 3)
+            if tokens_per_second is not None
+            else None,
+            "total_ms": round(self.now() * 1000, 3),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4)
+
+    def report(self) -> str:
+        lines = ["Timings"]
+        width = max(len(name) for name in (*self.spans, *self.marks, "requests coalesced")) + 2
+        for name, (count, total) in self.spans.items():
+            calls = f" ({count} calls)" if count > 1 else ""
+            lines.append(f"  {name:<{width}}{total * 1000:>10.1f} ms{calls}")
+        for name, value in self.marks.items():
+            lines.append(f"  {name:<{width}}{value * 1000:>10.1f} ms after start")
+        if self.critical_path:
+            lines.append(
+                f"  {'critical path':<{width}}{self.critical_path_duration * 1000:>10.1f} ms ({' > '.join(self.critical_path)})"
+            )
+        lines.append(f"  {'bytes received':<{width}}{self.bytes_received:>10}")
+        if self.chunks_coalesced:
+            lines.append(f"  {'chunks coalesced':<{width}}{self.chunks_coalesced:>10}")
+        if self.requests_coalesced:
+            lines.append(f"  {'requests coalesced':<{width}}{self.requests_coalesced:>10}")
+        tokens_per_second = self.tokens_per_second()
+        if tokens_per_second is not None:
+            lines.append(f"  {'streaming':<{width}}{self.streaming_time * 1000:>10.1f} ms")
+            lines.append(f"  {'tokens/s':<{width}}{tokens_per_second:>10.1f}")
+        lines.append(f"  {'total':<{width}}{self.now() * 1000:>10.1f} ms")
+        return "\n".join(lines)
@@ -84,50 +84,6 @@ async def async_get_binary_path(session):
     return binary_path
 
 
-# sync
-def sync_download_binary(session, output_path, file_url):
-    with open(output_path, "wb") as output_file:
-        response = session.get(
-            url=file_url, content_callback=lambda chunk: output_file.write(chunk)
-        )
-
-
-def sync_get_binary_path(session):
-    if binary_path is None:
-        return None
-
-    if not os.path.exists(funcaptcha_bin_folder_path) or not os.path.isdir(
-        funcaptcha_bin_folder_path
-    ):
-        os.mkdir(funcaptcha_bin_folder_path)
-
-    if os.path.isfile(binary_path):
-        try:
-            local_binary_hash = calculate_file_md5(binary_path)
-            response = session.get(latest_release_url)
-            json_data = response.json()
-
-            for line in json_data["body"].splitlines():
-                if line.startswith(current_os):
-                    latest_binary_hash = line.split("=")[-1]
-                    break
-
-            if local_binary_hash != latest_binary_hash:
-                file_url = get_file_url(json_data)
-
-                sync_download_binary(session, binary_path, file_url)
-        except:
-            return binary_path
-    else:
-        response = session.get(latest_release_url)
-        json_data = response.json()
-        file_url = get_file_url(json_data)
-
-        sync_download_binary(session, binary_path, file_url)
-
-    return binary_path
-
-
 def get_model_slug(chat):
     for _, message in chat.get("mapping", {}).items():
         if "message" in message:
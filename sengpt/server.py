@@ -0,0 +1,405 @@
+import asyncio
+import json
+import time
+import uuid
+from contextlib import aclosing
+from typing import Optional
+
+from .re_gpt.accounts import AccountPool
+from .re_gpt.async_chatgpt import MODELS, AsyncChatGPT, AsyncConversation
+from .re_gpt.errors import InvalidModelName, InvalidSessionToken
+
+# Request bodies larger than this are refused rather than read into memory
+MAX_BODY_BYTES = 4 * 1024 * 1024
+STATUS_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+}
+# ChatEvent finish reasons -> OpenAI's, responses cut off with max_tokens are continued so it's rarely "length"
+FINISH_REASONS = {"stop": "stop", "max_tokens": "length"}
+
+
+class HTTPRequest:
+    def __init__(self, method: str, path: str, headers: dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, error_type="invalid_request_error"):
+        self.status = status
+        self.message = message
+        self.error_type = error_type
+        super().__init__(message)
+
+    def to_dict(self) -> dict:
+        return {"error": {"message": self.message, "type": self.error_type}}
+
+
+class RequestTimings:
+    """
+    When a completion's milestones happened, sent in the Server-Timing header.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_chunk: Optional[float] = None
+
+    def header(self) -> str:
+        now = time.perf_counter()
+        metrics = []
+        if self.first_chunk is not None:
+            metrics.append(f"ttfc;dur={(self.first_chunk - self.start) * 1000:.1f}")
+        metrics.append(f"total;dur={(now - self.start) * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+class ChatCompletionServer:
+    """
+    Serves OpenAI's /v1/chat/completions, streamed or not, and /v1/models on top of a long lived client
+    so the auth token, the prefetched sentinel tokens and the warm connections are shared by every request.
+
+    Every completion is a new conversation holding the whole message history, deleted once it's answered
+    unless keep_conversations is set. Each connection is handled in its own task on the one event loop.
+    """
+
+    def __init__(
+        self,
+        client: AsyncChatGPT | AccountPool,
+        host="127.0.0.1",
+        port=8000,
+        model="gpt-3.5",
+        keep_conversations=False,
+    ):
+        """
+        Args:
+            client (AsyncChatGPT | AccountPool): An entered client.
+            host (str): The address to listen on. Defaults to "127.0.0.1".
+            port (int): The port to listen on, 0 picks a free one. Defaults to 8000.
+            model (str): The model used when a request's model isn't one of MODELS. Defaults to "gpt-3.5".
+            keep_conversations (bool): Keep the conversations made for the completions. Defaults to False.
+        """
+        self.client = client
+        self.host = host
+        self.port = port
+        self.model = model
+        self.keep_conversations = keep_conversations
+        self.server: Optional[asyncio.Server] = None
+        # conversation_id -> task deleting it
+        self.deletions: dict[str, asyncio.Task] = {}
+        # Task handling each open connection -> its writer
+        self.connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+        # Idle keep alive connections end as soon as their writer is closed instead of being cancelled
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        # Otherwise the conversations of the last completions would be left behind
+        await asyncio.gather(*self.deletions.values(), return_exceptions=True)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while request := await self.read_request(reader):
+                try:
+                    await self.route(request, writer)
+                except HTTPError as e:
+                    await self.send_json(writer, e.to_dict(), e.status)
+                except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    raise
+                except Exception as e:
+                    # A bug rather than a bad request, what was already written is unknown so the connection is closed
+                    error = HTTPError(500, f"{type(e).__name__}: {e}", "server_error")
+                    await self.send_json(writer, error.to_dict(), error.status, keep_alive=False)
+                    break
+                if not request.keep_alive:
+                    break
+        except HTTPError as e:
+            # The request couldn't be read so the connection can't be reused
+            await self.send_json(writer, e.to_dict(), e.status, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> Optional[HTTPRequest]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            # The client closed the connection between requests
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "identity").lower() != "identity":
+            # Chunked bodies aren't supported, reading the body as empty would drop the request
+            raise HTTPError(411, "Send the body with a Content-Length rather than chunked")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Malformed Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request bodies are limited to {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return HTTPRequest(method, target.partition("?")[0], headers, body)
+
+    async def route(self, request: HTTPRequest, writer: asyncio.StreamWriter) -> None:
+        if request.path == "/v1/chat/completions":
+            if request.method != "POST":
+                raise HTTPError(405, "Use POST")
+            try:
+                return await self.chat_completions(request, writer)
+            except InvalidModelName as e:
+                raise HTTPError(400, e.message)
+            except InvalidSessionToken as e:
+                # e.g., every account of the pool was left out
+                raise HTTPError(401, e.message, "authentication_error")
+        if request.path == "/v1/models":
+            models = [{"id": model, "object": "model", "owned_by": "openai"} for model in MODELS]
+            return await self.send_json(writer, {"object": "list", "data": models})
+        raise HTTPError(404, f"Unknown path {request.path}")
+
+    @staticmethod
+    def start_response(
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: dict[str, str],
+        keep_alive=True,
+    ) -> None:
+        lines = [f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}"]
+        lines.extend(f"{key}: {value}" for key, value in headers.items())
+        if not keep_alive:
+            lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+
+    async def send_json(
+        self,
+        writer: asyncio.StreamWriter,
+        data: dict,
+        status=200,
+        headers: Optional[dict[str, str]] = None,
+        keep_alive=True,
+    ) -> None:
+        body = json.dumps(data).encode()
+        ChatCompletionServer.start_response(
+            writer,
+            status,
+            {
+                "Content-Type": "application/json",
+                "Content-Length": str(len(body)),
+                **(headers or {}),
+            },
+            keep_alive,
+        )
+        writer.write(body)
+        await writer.drain()
+
+    @staticmethod
+    def build_prompt(messages: list) -> str:
+        """
+        Turn OpenAI messages into one prompt, a lone user message is sent as is and a history as a transcript.
+        """
+        if not isinstance(messages, list) or not messages:
+            raise HTTPError(400, "messages must be a non empty list")
+        turns = []
+        for message in messages:
+            if not isinstance(message, dict):
+                raise HTTPError(400, "Every message must be an object")
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                # Content parts, only the text ones can be sent
+                content = "\n".join(
+                    part.get("text", "") for part in content if isinstance(part, dict)
+                )
+            turns.append((str(message.get("role", "user")), str(content)))
+        if len(turns) == 1 and turns[0][0] == "user":
+            return turns[0][1]
+        return "\n\n".join(f"{role.capitalize()}: {content}" for role, content in turns)
+
+    def resolve_model(self, name: Optional[str]) -> str:
+        if name in MODELS:
+            return name
+        # e.g., "gpt-4-turbo" or "gpt-3.5-turbo"
+        for model in MODELS:
+            if isinstance(name, str) and name.startswith(model):
+                return model
+        return self.model
+
+    def finish(self, conversation: AsyncConversation) -> None:
+        conversation_id = conversation.conversation_id
+        # Completions of the same prompt share a conversation with single flight on
+        if self.keep_conversations or not conversation_id or conversation_id in self.deletions:
+            return
+        task = asyncio.create_task(conversation.delete())
+        self.deletions[conversation_id] = task
+        task.add_done_callback(lambda _: self.deletions.pop(conversation_id, None))
+        # A failed deletion only leaves the conversation behind
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def chat_completions(self, request: HTTPRequest, writer: asyncio.StreamWriter) -> None:
+        timings = RequestTimings()
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            raise HTTPError(400, "The body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "The body must be a JSON object")
+        prompt = ChatCompletionServer.build_prompt(body.get("messages"))
+        model = self.resolve_model(body.get("model"))
+        conversation = self.client.create_new_conversation(model)
+        completion = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": model,
+        }
+        try:
+            async with aclosing(conversation.stream(prompt)) as events:
+                if body.get("stream"):
+                    await self.stream_completion(events, completion, timings, request, writer)
+                else:
+                    await self.send_completion(events, completion, timings, writer)
+        finally:
+            self.finish(conversation)
+
+    async def send_completion(
+        self,
+        events,
+        completion: dict,
+        timings: RequestTimings,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        content: list[str] = []
+        finish_reason = None
+        try:
+            async for event in events:
+                if timings.first_chunk is None:
+                    timings.first_chunk = time.perf_counter()
+                content.append(event.content)
+                finish_reason = event.finish_reason
+        except Exception as e:
+            raise HTTPError(502, str(e), "upstream_error")
+        await self.send_json(
+            writer,
+            {
+                **completion,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(content)},
+                        "finish_reason": FINISH_REASONS.get(finish_reason, "stop"),
+                    }
+                ],
+            },
+            headers={"Server-Timing": timings.header()},
+        )
+
+    async def stream_completion(
+        self,
+        events,
+        completion: dict,
+        timings: RequestTimings,
+        request: HTTPRequest,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Stream the completion as chunked server sent events. The headers are only sent with the first chunk
+        so they carry the time to first chunk and a failure before it is still a proper error response,
+        the total time is sent as a trailer.
+        """
+
+        def write_event(data) -> None:
+            event = f"data: {json.dumps(data) if not isinstance(data, str) else data}\n\n".encode()
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> dict:
+            return {
+                **completion,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        finish_reason = None
+        try:
+            async for event in events:
+                if timings.first_chunk is None:
+                    timings.first_chunk = time.perf_counter()
+                    ChatCompletionServer.start_response(
+                        writer,
+                        200,
+                        {
+                            "Content-Type": "text/event-stream",
+                            "Cache-Control": "no-cache",
+                            "Transfer-Encoding": "chunked",
+                            "Trailer": "Server-Timing",
+                            "Server-Timing": timings.header(),
+                        },
+                        request.keep_alive,
+                    )
+                    write_event(chunk({"role": "assistant", "content": ""}))
+                finish_reason = event.finish_reason
+                if event.content:
+                    write_event(chunk({"content": event.content}))
+                # Waits for the client to read what was written, a closed connection raises here
+                # and closes the response's stream which aborts the request
+                await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            if timings.first_chunk is None:
+                raise HTTPError(502, str(e), "upstream_error")
+            # Too late for an error status
+            write_event(HTTPError(502, str(e), "upstream_error").to_dict())
+        else:
+            if timings.first_chunk is None:
+                raise HTTPError(502, "The response was empty", "upstream_error")
+            write_event(chunk({}, FINISH_REASONS.get(finish_reason, "stop")))
+        write_event("[DONE]")
+        writer.write(f"0\r\nServer-Timing: {timings.header()}\r\n\r\n".encode())
+        await writer.drain()